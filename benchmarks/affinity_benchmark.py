@@ -0,0 +1,88 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import time
+
+import numpy as np
+from l2explorer.l2explorer_affinity import round_robin_layout
+from l2explorer.l2explorer_vec_env import L2ExplorerVecEnv
+
+"""
+Run-to-run variance of L2ExplorerVecEnv steps/sec with and without CPU pinning.
+Each configuration is run -repeats times; -load starts that many busy processes
+standing in for learners competing for the cores.
+Worker ids base_worker_id .. base_worker_id + workers - 1 must be free.
+python affinity_benchmark.py -jsonfile ../examples/map_simple.json -workers 8 -cpus_per_player 2 -load 8
+"""
+
+
+def busy(stop):
+    # Stands in for a learner process keeping a core busy
+    a = np.random.random_sample((256, 256))
+    while not stop.is_set():
+        a = a @ a
+        a /= np.abs(a).max()
+
+
+def bench(n, params, steps, base_worker_id, cpu_affinity):
+    with L2ExplorerVecEnv(n, base_worker_id=base_worker_id, cpu_affinity=cpu_affinity) as vec_env:
+        vec_env.reset(params)
+        actions = np.zeros((n, 3))
+        start = time.perf_counter()
+        for _ in range(steps):
+            vec_env.step(actions)
+        wall = time.perf_counter() - start
+    return n * steps / wall
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Steps/sec variance with and without CPU pinning")
+    parser.add_argument('-jsonfile', type=str, required=True, help="File to environment JSON.")
+    parser.add_argument('-workers', type=int, default=8, help="Number of workers (def=8)")
+    parser.add_argument('-steps', type=int, default=500, help="Steps per worker and run (def=500)")
+    parser.add_argument('-repeats', type=int, default=5, help="Runs per configuration (def=5)")
+    parser.add_argument('-cpus_per_player', type=int, default=2, help="Cores pinned per player (def=2)")
+    parser.add_argument('-cpus_per_driver', type=int, default=1, help="Cores pinned per driver (def=1)")
+    parser.add_argument('-nice', type=int, default=None, help="Nice level of the players (def=unchanged)")
+    parser.add_argument('-load', type=int, default=0, help="Busy background processes (def=0)")
+    parser.add_argument('-base_worker_id', type=int, default=0, help="First worker id to use (def=0)")
+    args = parser.parse_args()
+
+    with open(args.jsonfile) as json_file:
+        params = json.load(json_file)
+    params['max_steps'] = args.steps + 1
+    layout = round_robin_layout(args.workers, args.cpus_per_player, args.cpus_per_driver, args.nice)
+
+    ctx = mp.get_context('spawn')
+    stop = ctx.Event()
+    load = [ctx.Process(target=busy, args=(stop,), daemon=True) for _ in range(args.load)]
+    for process in load:
+        process.start()
+    try:
+        print(f'{"configuration":>14} {"mean steps/s":>13} {"std":>8} {"cv":>6}')
+        for name, cpu_affinity in (('unpinned', None), ('pinned', layout)):
+            rates = [bench(args.workers, params, args.steps, args.base_worker_id, cpu_affinity)
+                     for _ in range(args.repeats)]
+            print(f'{name:>14} {np.mean(rates):>13.1f} {np.std(rates):>8.1f} {np.std(rates) / np.mean(rates):>6.1%}')
+    finally:
+        stop.set()
+        for process in load:
+            process.join()
@@ -0,0 +1,85 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+from l2explorer.l2explorer_env import L2ExplorerTask
+
+"""
+Steps/sec of one L2ExplorerTask against the engine time_scale. Every time scale
+replays the same action sequence from the same reset, and the agent path is
+compared with the path at the first (reference) time scale: a large deviation
+means physics no longer behaves at that speed.
+python engine_config_benchmark.py -jsonfile ../examples/map_simple.json -time_scales 1 5 20 50 100
+"""
+
+
+def run_episode(task, params, actions):
+    task.reset(params)
+    path = []
+    start = time.perf_counter()
+    for action in actions:
+        obs, _, done, _ = task.step(action)
+        path.append(np.array(obs['state'][:2]))
+        if done:
+            break
+    return len(path) / (time.perf_counter() - start), np.array(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Steps/sec and physics deviation per engine time scale")
+    parser.add_argument('-jsonfile', type=str, required=True, help="File to environment JSON.")
+    parser.add_argument('-time_scales', type=float, nargs='+', default=[1, 2, 5, 10, 20, 50, 100],
+                        help="Time scales to sweep, the first is the reference (def=1 2 5 10 20 50 100)")
+    parser.add_argument('-steps', type=int, default=500, help="Steps per time scale (def=500)")
+    parser.add_argument('-target_frame_rate', type=int, default=-1, help="Target frame rate, -1 unlimited (def=-1)")
+    parser.add_argument('-quality_level', type=int, default=None, help="Unity quality level (def=player default)")
+    parser.add_argument('-backend', type=str, default=None, help="unity or fake (def=L2EXPLORER_BACKEND)")
+    parser.add_argument('-seed', type=int, default=1234, help="Seed of the environment and the actions (def=1234)")
+    args = parser.parse_args()
+
+    with open(args.jsonfile) as json_file:
+        params = json.load(json_file)
+    params['max_steps'] = args.steps + 1
+    rng = np.random.RandomState(args.seed)
+    actions = rng.random_sample((args.steps, 3)) - 0.5
+    actions[:, 0] *= 10
+    actions[:, 1] *= 90
+
+    engine_config = {'target_frame_rate': args.target_frame_rate}
+    if args.quality_level is not None:
+        engine_config['quality_level'] = args.quality_level
+    task = L2ExplorerTask(backend=args.backend, engine_config=engine_config)
+    task.seed(args.seed)
+    reference = None
+    print(f'{"time_scale":>10} {"steps/s":>10} {"mean deviation":>15} {"max deviation":>14}')
+    try:
+        for time_scale in args.time_scales:
+            # Applied between episodes, with the reset of the next one
+            task.set_engine_config(time_scale=time_scale)
+            rate, path = run_episode(task, params, actions)
+            if reference is None:
+                reference = path
+            n = min(len(path), len(reference))
+            deviation = np.linalg.norm(path[:n] - reference[:n], axis=1)
+            print(f'{time_scale:>10g} {rate:>10.1f} {deviation.mean():>15.3f} {deviation.max():>14.3f}')
+    finally:
+        task.close_env()
@@ -0,0 +1,64 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import argparse
+import time
+
+import numpy as np
+from l2explorer.l2explorer_env import L2ExplorerTask
+
+"""
+Per-step cost of the metrics registry. Steps the fake backend (no simulated
+latency, so the wrapper cost is not hidden) with metrics disabled and enabled.
+With metrics disabled no method is instrumented, so step() runs the same code
+as before metrics existed.
+python metrics_overhead_benchmark.py -steps 5000
+"""
+
+
+def time_steps(metrics, params, steps, repeats):
+    task = L2ExplorerTask(worker_id=0, backend='fake', metrics=metrics)
+    task.seed(1234)
+    action = np.zeros(3)
+    best = float('inf')
+    try:
+        for _ in range(repeats):
+            task.reset(params)
+            start = time.perf_counter()
+            for _ in range(steps):
+                task.step(action)
+            best = min(best, (time.perf_counter() - start) / steps)
+        instrumented = sorted(task.metrics.histograms) if task.metrics else []
+    finally:
+        task.close_env()
+    return best, instrumented
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Overhead of L2ExplorerTask metrics per step")
+    parser.add_argument('-steps', type=int, default=2000, help="Steps per repeat (def=2000)")
+    parser.add_argument('-repeats', type=int, default=5, help="Repeats, the fastest is reported (def=5)")
+    parser.add_argument('-size', type=int, default=84, help="observation_size (def=84)")
+    args = parser.parse_args()
+
+    params = {"max_steps": args.steps + 1, "agent_params": {"observation_size": args.size}}
+    disabled, _ = time_steps(False, params, args.steps, args.repeats)
+    enabled, instrumented = time_steps(True, params, args.steps, args.repeats)
+    print(f'metrics disabled {1e6 * disabled:8.2f} us/step')
+    print(f'metrics enabled  {1e6 * enabled:8.2f} us/step (+{1e6 * (enabled - disabled):.2f} us, '
+          f'{len(instrumented)} metrics)')
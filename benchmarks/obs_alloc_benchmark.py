@@ -0,0 +1,80 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+from l2explorer.l2explorer_obs import ObservationBuffer, preprocess_visual
+
+"""
+Microbenchmark of the per-step visual observation conversion. Compares the
+default path, which builds a new list of converted arrays every step, with
+writing into preallocated ObservationBuffers (the obs_buffers option of
+L2ExplorerTask). Reports bytes allocated per step as seen by tracemalloc.
+python obs_alloc_benchmark.py -size 128 -uint8
+"""
+
+
+def make_cameras(n_cameras, size):
+    # Same layout as the visual observations of a DecisionSteps: [n_agents, H, W, C] float32
+    return [np.random.random_sample((1, size, size, 3)).astype(np.float32) for _ in range(n_cameras)]
+
+
+def legacy_step(cameras, uint8_visual):
+    return [preprocess_visual(obs[0], uint8_visual) for obs in cameras]
+
+
+def measure(fn, steps):
+    fn()  # warm up
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    allocated = 0
+    start = time.perf_counter()
+    for _ in range(steps):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+        allocated += peak - before
+        del result
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    return allocated / steps, elapsed / steps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Allocations per step of visual observation conversion")
+    parser.add_argument('-size', type=int, default=84, help="Observation size (def=84)")
+    parser.add_argument('-cameras', type=int, default=3, help="Number of cameras (def=3)")
+    parser.add_argument('-steps', type=int, default=1000, help="Steps to measure (def=1000)")
+    parser.add_argument('-ring', type=int, default=4, help="Ring size of the preallocated buffers (def=4)")
+    parser.add_argument('-uint8', action='store_true', help="Convert to uint8 observations")
+    args = parser.parse_args()
+
+    cameras = make_cameras(args.cameras, args.size)
+    buffer = ObservationBuffer(args.cameras, (args.size, args.size, 3), args.uint8, args.ring)
+
+    legacy_bytes, legacy_time = measure(lambda: legacy_step(cameras, args.uint8), args.steps)
+    buffer_bytes, buffer_time = measure(lambda: buffer.write(cameras), args.steps)
+
+    print(f'{args.cameras} cameras {args.size}x{args.size}, uint8={args.uint8}')
+    print(f'{"path":>14} {"bytes/step":>12} {"us/step":>10}')
+    print(f'{"new arrays":>14} {legacy_bytes:>12.0f} {1e6 * legacy_time:>10.1f}')
+    print(f'{"obs_buffers":>14} {buffer_bytes:>12.0f} {1e6 * buffer_time:>10.1f}')
@@ -0,0 +1,78 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from functools import partial
+
+import numpy as np
+from l2explorer.l2explorer_env import L2ExplorerTask
+from l2explorer.l2explorer_fake import FakeUnityEnvironment
+from l2explorer.l2explorer_recorder import L2ExplorerRecorder
+
+"""
+Steps/sec of L2ExplorerTask with and without L2ExplorerRecorder, compressed
+and uncompressed, on the fake backend.
+python recorder_benchmark.py -steps 2000 -latency 5 -uint8
+"""
+
+
+def run(env, params, steps):
+    env.reset(params)
+    action = np.array([1.0, 10.0, 0.0])
+    start = time.perf_counter()
+    for _ in range(steps):
+        _, _, done, _ = env.step(action)
+        if done:
+            env.reset(params)
+    return steps / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Overhead of L2ExplorerRecorder on steps/sec")
+    parser.add_argument('-steps', type=int, default=2000, help="Steps per run (def=2000)")
+    parser.add_argument('-latency', type=float, default=5.0, help="Step latency of the fake backend in ms (def=5)")
+    parser.add_argument('-size', type=int, default=84, help="observation_size (def=84)")
+    parser.add_argument('-chunk_size', type=int, default=500, help="Rows per chunk (def=500)")
+    parser.add_argument('-uint8', action='store_true', help="Record uint8 visual observations")
+    args = parser.parse_args()
+
+    params = {"max_steps": 500, "agent_params": {"observation_size": args.size}}
+    backend = partial(FakeUnityEnvironment, step_latency=args.latency / 1000.0)
+    task = L2ExplorerTask(worker_id=0, backend=backend, uint8_visual=args.uint8)
+    task.seed(1234)
+    try:
+        baseline = run(task, params, args.steps)
+        print(f'{"no recorder":>22} {baseline:>8.1f} steps/s')
+        for compress in (False, True):
+            directory = tempfile.mkdtemp(prefix='l2explorer_recording_')
+            try:
+                recorder = L2ExplorerRecorder(task, directory, chunk_size=args.chunk_size, compress=compress)
+                rate = run(recorder, params, args.steps)
+                start = time.perf_counter()
+                recorder.close()
+                close_time = time.perf_counter() - start
+            finally:
+                shutil.rmtree(directory)
+            label = 'compressed' if compress else 'uncompressed'
+            print(f'{label:>22} {rate:>8.1f} steps/s ({100 * (1 - rate / baseline):.1f}% slower, '
+                  f'close took {close_time:.2f} s)')
+    finally:
+        task.close_env()
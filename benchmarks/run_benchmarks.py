@@ -0,0 +1,245 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import argparse
+import copy
+import json
+import os
+import platform
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+
+import numpy as np
+from l2explorer.l2explorer_env import (L2ExplorerInstance, L2ExplorerTask,
+                                       needs_player)
+from l2explorer.l2explorer_fake import FakeUnityEnvironment
+from l2explorer.utils import get_l2explorer_app_location
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+"""
+End-to-end benchmark suite of L2ExplorerTask. For every combination of
+observation_size, uint8_visual and object count it measures reset latency
+percentiles, steps/sec, the per-step time split between the Unity round-trip,
+side-channel handling and observation preprocessing, bytes allocated per step
+and peak RSS, and writes everything to a JSON file. Every configuration runs in
+a fresh process with its own player, so peak_rss_kb is the peak of that
+configuration alone (ru_maxrss only grows over the life of a process).
+Runs against the Unity player (needs L2EXPLORER_APP) or the fake backend:
+python run_benchmarks.py -backend fake -latency 2 -out results.json
+"""
+
+DEFAULT_JSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'map_findobjects_0.json')
+
+
+class PhaseTimer(object):
+    # Times calls of methods by shadowing them with timed wrappers on the instance
+    def __init__(self):
+        self.totals = {}
+        self._wrapped = []
+
+    def wrap(self, obj, method_name, phase):
+        original = getattr(obj, method_name)
+        self.totals.setdefault(phase, 0.0)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.totals[phase] += time.perf_counter() - start
+        setattr(obj, method_name, timed)
+        self._wrapped.append((obj, method_name))
+
+    def clear(self):
+        for phase in self.totals:
+            self.totals[phase] = 0.0
+
+    def unwrap(self):
+        for obj, method_name in self._wrapped:
+            delattr(obj, method_name)
+        self._wrapped = []
+
+
+def make_params(base_params, observation_size, n_objects, max_steps, rng):
+    # Reset payload with n_objects copies of the base objects at random positions
+    params = copy.deepcopy(base_params)
+    params['max_steps'] = max_steps
+    params['agent_params']['observation_size'] = observation_size
+    base_objects = base_params.get('objects', [])
+    if n_objects is not None and base_objects:
+        coordinates = np.array([obj['coordinates'] for obj in base_objects])
+        low, high = coordinates.min(axis=0), coordinates.max(axis=0)
+        params['objects'] = [dict(base_objects[i % len(base_objects)],
+                                  coordinates=rng.uniform(low, high).tolist()) for i in range(n_objects)]
+    return params
+
+
+def random_action(rng):
+    return (rng.random_sample(3) - 0.5) * np.array([10.0, 90.0, 1.0])
+
+
+def peak_rss_kb():
+    # Peak RSS of this process so far, see run_config.
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if platform.system() == 'Darwin' else rss
+
+
+def bench_config(instance, params, uint8_visual, resets, steps, alloc_steps, rng):
+    task = L2ExplorerTask(instance=instance, uint8_visual=uint8_visual, metrics=False)
+    timer = PhaseTimer()
+    try:
+        latencies = []
+        for _ in range(resets):
+            task.reset(params)
+            latencies.append(task.last_reset_latency)
+
+        # Side channel callbacks run inside UnityEnvironment.step, their time is
+        # subtracted from the round-trip below
+        timer.wrap(instance.env, 'step', 'unity_step')
+        for channel in (instance.reset_channel, instance.debug_channel, instance.state_channel):
+            timer.wrap(channel, 'on_message_received', 'side_channels')
+        timer.wrap(task, '_single_step', 'preprocess')
+        timer.clear()
+        start = time.perf_counter()
+        for _ in range(steps):
+            _, _, done, _ = task.step(random_action(rng))
+            if done:
+                task.reset(params)
+        elapsed = time.perf_counter() - start
+        timer.unwrap()
+
+        allocated = 0
+        tracemalloc.start()
+        for _ in range(alloc_steps):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            result = task.step(random_action(rng))
+            _, peak = tracemalloc.get_traced_memory()
+            allocated += peak - before
+            del result
+            if task.game_over:
+                task.reset(params)
+        tracemalloc.stop()
+    finally:
+        timer.unwrap()
+        task.close_env()
+
+    totals = {phase: 1000.0 * total / steps for phase, total in timer.totals.items()}
+    split = {
+        'unity_round_trip': totals['unity_step'] - totals['side_channels'],
+        'side_channels': totals['side_channels'],
+        'preprocess': totals['preprocess'],
+    }
+    split['other'] = 1000.0 * elapsed / steps - sum(split.values())
+    latencies_ms = 1000.0 * np.array(latencies)
+    return {
+        'reset_latency_ms': {'p50': float(np.percentile(latencies_ms, 50)),
+                             'p95': float(np.percentile(latencies_ms, 95)),
+                             'p99': float(np.percentile(latencies_ms, 99)),
+                             'mean': float(latencies_ms.mean())},
+        'steps_per_sec': steps / elapsed,
+        'time_per_step_ms': split,
+        'bytes_allocated_per_step': allocated / max(alloc_steps, 1),
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def run_config(filename, worker_id, seed, backend, params, uint8_visual, resets, steps, alloc_steps):
+    # Entry point of the process running one configuration, which launches its own player
+    rng = np.random.RandomState(seed)
+    instance = L2ExplorerInstance(filename, worker_id, seed, backend=backend)
+    try:
+        return bench_config(instance, params, uint8_visual, resets, steps, alloc_steps, rng)
+    finally:
+        instance.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and latency benchmarks of L2ExplorerTask")
+    parser.add_argument('-backend', type=str, default='fake', choices=['unity', 'fake'],
+                        help="Run against the Unity player or the fake backend (def=fake)")
+    parser.add_argument('-latency', type=float, default=0.0, help="Step latency of the fake backend in ms (def=0)")
+    parser.add_argument('-jsonfile', type=str, default=DEFAULT_JSON, help="Base environment JSON")
+    parser.add_argument('-sizes', type=int, nargs='+', default=[84, 128, 256], help="observation_size sweep")
+    parser.add_argument('-objects', type=int, nargs='+', default=[8, 64],
+                        help="Object counts in the reset payload (def=8 64)")
+    parser.add_argument('-resets', type=int, default=20, help="Resets per configuration (def=20)")
+    parser.add_argument('-steps', type=int, default=300, help="Timed steps per configuration (def=300)")
+    parser.add_argument('-alloc_steps', type=int, default=50, help="Steps traced for allocations (def=50)")
+    parser.add_argument('-worker_id', type=int, default=0, help="Worker id of the instance (def=0)")
+    parser.add_argument('-seed', type=int, default=1234, help="Seed (def=1234)")
+    parser.add_argument('-out', type=str, default='benchmark_results.json', help="Output JSON file")
+    args = parser.parse_args()
+
+    with open(args.jsonfile) as json_file:
+        base_params = json.load(json_file)
+    backend = args.backend
+    if backend == 'fake':
+        backend = partial(FakeUnityEnvironment, step_latency=args.latency / 1000.0)
+    filename = get_l2explorer_app_location() if needs_player(backend) else None
+    rng = np.random.RandomState(args.seed)
+
+    results = []
+    for size in args.sizes:
+        for n_objects in args.objects:
+            params = make_params(base_params, size, n_objects, args.steps + 1, rng)
+            for uint8_visual in (False, True):
+                # A fresh (spawned, not forked) process per configuration for its peak RSS
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                    result = executor.submit(run_config, filename, args.worker_id, args.seed + len(results),
+                                             backend, params, uint8_visual, args.resets, args.steps,
+                                             args.alloc_steps).result()
+                result.update(observation_size=size, objects=n_objects, uint8_visual=uint8_visual)
+                results.append(result)
+                split = result['time_per_step_ms']
+                print(f'size {size:>4} objects {n_objects:>4} uint8 {uint8_visual!s:>5}: '
+                      f'{result["steps_per_sec"]:>8.1f} steps/s, '
+                      f'reset p50 {result["reset_latency_ms"]["p50"]:.1f} ms, '
+                      f'round-trip {split["unity_round_trip"]:.2f} ms, '
+                      f'preprocess {split["preprocess"]:.2f} ms, '
+                      f'{result["bytes_allocated_per_step"] / 1024:.1f} KB/step, '
+                      f'peak RSS {result["peak_rss_kb"]} KB')
+
+    report = {
+        'meta': {
+            'backend': args.backend,
+            'fake_latency_ms': args.latency if args.backend == 'fake' else None,
+            'jsonfile': os.path.basename(args.jsonfile),
+            'resets': args.resets,
+            'steps': args.steps,
+            'peak_rss': 'peak RSS in KB of the process running the configuration',
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    with open(args.out, 'w') as out_file:
+        json.dump(report, out_file, indent=2)
+    print(f'Results written to {args.out}')
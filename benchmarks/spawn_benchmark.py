@@ -0,0 +1,72 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import argparse
+import time
+
+import numpy as np
+from l2explorer.l2explorer_env import L2ExplorerTask
+
+"""
+Objects spawned per second mid-episode: one object_create message built and
+sent at a time (as spawn_object did before spawn_objects) against
+spawn_objects() batches. Each batch is delivered by the following step; the
+fake backend stands in for Unity.
+python spawn_benchmark.py -objects 500 -batches 20
+"""
+
+
+def make_specs(rng, n):
+    return [{"class": "tree", "model": "49", "coordinates": [float(x), float(y)],
+             "color": [0.0, 0.0, 1.0], "motion_model": "stationary"}
+            for x, y in rng.uniform(-100, 100, (n, 2))]
+
+
+def spawn_one_by_one(task, specs):
+    for spec in specs:
+        task._reset_channel.send_json({"action": "object_create", "payload": spec})
+
+
+def bench(task, params, specs, batches, spawn):
+    task.reset(params)
+    start = time.perf_counter()
+    for _ in range(batches):
+        spawn(task, specs)
+        task.step(np.zeros(3))
+    return len(specs) * batches / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Objects/sec of spawn_objects() against one message at a time")
+    parser.add_argument('-objects', type=int, default=500, help="Objects per batch (def=500)")
+    parser.add_argument('-batches', type=int, default=20, help="Batches to spawn (def=20)")
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(1234)
+    specs = make_specs(rng, args.objects)
+    params = {"max_steps": args.batches + 1}
+    task = L2ExplorerTask(worker_id=0, backend='fake', metrics=False)
+    task.seed(1234)
+    try:
+        single = bench(task, params, specs, args.batches, spawn_one_by_one)
+        batched = bench(task, params, specs, args.batches, lambda task, specs: task.spawn_objects(specs))
+    finally:
+        task.close_env()
+    print(f'{args.objects} objects per batch')
+    print(f'{"one message at a time":>22} {single:>10.0f} objects/s')
+    print(f'{"spawn_objects":>22} {batched:>10.0f} objects/s ({batched / single:.2f}x)')
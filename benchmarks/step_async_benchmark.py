@@ -0,0 +1,73 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import argparse
+import time
+from functools import partial
+
+import numpy as np
+from l2explorer.l2explorer_env import L2ExplorerTask
+from l2explorer.l2explorer_fake import FakeUnityEnvironment
+
+"""
+Throughput of step() against step_async()/step_wait() when the agent has work
+that does not depend on the next observation (learner updates, logging).
+Unity is replaced by the fake backend sleeping for a configurable latency per step.
+python step_async_benchmark.py -latency 10 -work 5
+"""
+
+
+def work(seconds):
+    # Stands in for GIL-releasing work such as a learner update on a GPU
+    time.sleep(seconds)
+
+
+def bench(task, params, steps, work_time, use_async):
+    task.reset(params)
+    action = np.zeros(3)
+    start = time.perf_counter()
+    for _ in range(steps):
+        if use_async:
+            task.step_async(action)
+            work(work_time)
+            task.step_wait()
+        else:
+            task.step(action)
+            work(work_time)
+    return steps / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="step() vs step_async()/step_wait() throughput")
+    parser.add_argument('-latency', type=float, default=10.0, help="Simulated Unity step latency in ms (def=10)")
+    parser.add_argument('-work', type=float, default=5.0, help="Agent work per step in ms (def=5)")
+    parser.add_argument('-steps', type=int, default=200, help="Steps to measure (def=200)")
+    args = parser.parse_args()
+
+    backend = partial(FakeUnityEnvironment, step_latency=args.latency / 1000.0)
+    params = {"max_steps": args.steps + 1}
+    task = L2ExplorerTask(worker_id=0, backend=backend)
+    task.seed(1234)
+    try:
+        sync_rate = bench(task, params, args.steps, args.work / 1000.0, use_async=False)
+        async_rate = bench(task, params, args.steps, args.work / 1000.0, use_async=True)
+    finally:
+        task.close_env()
+    print(f'latency {args.latency} ms, agent work {args.work} ms')
+    print(f'{"step()":>24} {sync_rate:>8.1f} steps/s')
+    print(f'{"step_async/step_wait":>24} {async_rate:>8.1f} steps/s ({async_rate / sync_rate:.2f}x)')
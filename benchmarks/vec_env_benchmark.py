@@ -0,0 +1,103 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import time
+
+import numpy as np
+from l2explorer.l2explorer_env import L2ExplorerTask
+from l2explorer.l2explorer_vec_env import L2ExplorerVecEnv
+
+"""
+Compare aggregate steps/sec of L2ExplorerVecEnv, with observations pickled
+through pipes and through shared memory, against the same number of separate
+processes that each drive one L2ExplorerTask.
+Worker ids base_worker_id .. base_worker_id + max(workers) - 1 must be free.
+python vec_env_benchmark.py -jsonfile ../examples/map_simple.json -steps 500
+"""
+
+
+def random_actions(n):
+    actions = np.random.random_sample((n, 3)) - 0.5
+    actions[:, 0] *= 10
+    actions[:, 1] *= 90
+    return actions
+
+
+def _separate_task(worker_id, params, steps, barrier, result_queue):
+    task = L2ExplorerTask(worker_id=worker_id)
+    try:
+        task.reset(params)
+        barrier.wait()
+        start = time.perf_counter()
+        for _ in range(steps):
+            _, _, done, _ = task.step(random_actions(1)[0])
+            if done:
+                task.reset(params)
+        result_queue.put((start, time.perf_counter()))
+    finally:
+        task.close_env()
+
+
+def bench_separate(n, params, steps, base_worker_id):
+    ctx = mp.get_context('spawn')
+    barrier = ctx.Barrier(n)
+    result_queue = ctx.Queue()
+    processes = [ctx.Process(target=_separate_task,
+                             args=(base_worker_id + i, params, steps, barrier, result_queue))
+                 for i in range(n)]
+    for process in processes:
+        process.start()
+    spans = [result_queue.get() for _ in range(n)]
+    for process in processes:
+        process.join()
+    wall = max(end for _, end in spans) - min(start for start, _ in spans)
+    return n * steps / wall
+
+
+def bench_vec(n, params, steps, base_worker_id, shared_memory=False):
+    with L2ExplorerVecEnv(n, base_worker_id=base_worker_id, shared_memory=shared_memory) as vec_env:
+        vec_env.reset(params)
+        start = time.perf_counter()
+        for _ in range(steps):
+            vec_env.step(random_actions(n))
+        wall = time.perf_counter() - start
+    return n * steps / wall
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Steps/sec of L2ExplorerVecEnv vs separate processes")
+    parser.add_argument('-jsonfile', type=str, required=True, help="File to environment JSON.")
+    parser.add_argument('-steps', type=int, default=500, help="Steps per worker (def=500)")
+    parser.add_argument('-workers', type=int, nargs='+', default=[1, 4, 8, 16],
+                        help="Worker counts to sweep (def=1 4 8 16)")
+    parser.add_argument('-base_worker_id', type=int, default=0, help="First worker id to use (def=0)")
+    args = parser.parse_args()
+
+    with open(args.jsonfile) as json_file:
+        parsed_json = json.load(json_file)
+
+    print(f'{"workers":>8} {"separate steps/s":>18} {"vec env steps/s":>16} {"shared memory steps/s":>22} '
+          f'{"speedup":>8}')
+    for n in args.workers:
+        separate = bench_separate(n, parsed_json, args.steps, args.base_worker_id)
+        vectorized = bench_vec(n, parsed_json, args.steps, args.base_worker_id)
+        shared = bench_vec(n, parsed_json, args.steps, args.base_worker_id, shared_memory=True)
+        print(f'{n:>8} {separate:>18.1f} {vectorized:>16.1f} {shared:>22.1f} {shared / separate:>8.2f}')
@@ -23,7 +23,7 @@ import random
 from collections import deque
 
 import numpy as np
-from l2explorer.l2explorer_env import L2ExplorerTask
+from l2explorer.l2explorer_pool import L2ExplorerPool
 from l2logger import l2logger
 
 """
@@ -172,18 +172,24 @@ class LinearAgent:
 
 def run_scenario(agent, performance_logger):
     last_seq = SequenceNums(-1, -1)
-    game = L2ExplorerTask()
-    while not agent.complete():
-        exp = agent.next_experience()
-        cur_seq = exp.sequence_nums
-        # check for new block
-        if last_seq.block_num != cur_seq.block_num:
-            print("new block:", cur_seq.block_num)
-        results = exp.run(game)
-        log_data(performance_logger, exp, results)
-
-        last_seq = cur_seq
-    game.close_env()
+    # The Unity player is launched once by the pool and leased for each block
+    with L2ExplorerPool(1) as pool:
+        game = None
+        while not agent.complete():
+            exp = agent.next_experience()
+            cur_seq = exp.sequence_nums
+            # check for new block
+            if last_seq.block_num != cur_seq.block_num:
+                print("new block:", cur_seq.block_num)
+                if game:
+                    pool.release(game)
+                game = pool.lease()
+            results = exp.run(game)
+            log_data(performance_logger, exp, results)
+
+            last_seq = cur_seq
+        if game:
+            pool.release(game)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Dummy agent for playing L2Explorer games with logging")
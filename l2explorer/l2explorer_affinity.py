@@ -0,0 +1,131 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import glob
+import os
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+"""
+CPU affinity and priority of Unity players and the Python processes driving
+them, for nodes where players and learners compete for cores. Linux only:
+elsewhere pinning is skipped with a warning.
+"""
+
+_NODE_CPULISTS = '/sys/devices/system/node/node*/cpulist'
+
+
+def parse_cpu_list(text: str) -> Tuple[int, ...]:
+    """CPUs of a Linux cpu list such as '0-3,8,10-11'"""
+    cpus = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return tuple(cpus)
+
+
+def format_cpu_list(cpus: Sequence[int]) -> str:
+    """Inverse of parse_cpu_list"""
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(str(first) if first == last else f'{first}-{last}' for first, last in ranges)
+
+
+def numa_nodes() -> List[Tuple[int, ...]]:
+    """The CPUs of each NUMA node this process may run on, one node holding all of
+    them when the topology is unknown"""
+    allowed = set(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else set(range(os.cpu_count()))
+    nodes = []
+    for path in sorted(glob.glob(_NODE_CPULISTS), key=lambda p: int(p.split('node')[-1].split('/')[0])):
+        with open(path) as cpulist:
+            cpus = tuple(cpu for cpu in parse_cpu_list(cpulist.read()) if cpu in allowed)
+        if cpus:
+            nodes.append(cpus)
+    return nodes or [tuple(sorted(allowed))]
+
+
+class CpuAffinity(NamedTuple):
+    """Cores of one Unity player and of its Python driver, and the nice level of
+    the player. None leaves the setting alone."""
+    player_cpus: Optional[Tuple[int, ...]] = None
+    driver_cpus: Optional[Tuple[int, ...]] = None
+    nice: Optional[int] = None
+
+
+def round_robin_layout(count: int, cpus_per_player: int, cpus_per_driver: int = 1,
+                       nice: Optional[int] = None) -> List[CpuAffinity]:
+    """CpuAffinity of count player/driver pairs dealt round-robin across the NUMA
+    nodes, so pairs sit on one node and nodes fill evenly. A pair gets disjoint
+    cores on its node while they last; further pairs wrap around and share."""
+    nodes = numa_nodes()
+    used = [0] * len(nodes)
+    layout = []
+    for i in range(count):
+        node = i % len(nodes)
+        cpus = nodes[node]
+        start = used[node]
+        used[node] += cpus_per_player + cpus_per_driver
+        picked = [cpus[(start + j) % len(cpus)] for j in range(cpus_per_player + cpus_per_driver)]
+        layout.append(CpuAffinity(tuple(picked[:cpus_per_player]) or None,
+                                  tuple(picked[cpus_per_player:]) or None, nice))
+    return layout
+
+
+def _threads(pid: int) -> List[int]:
+    # Affinity and nice are per thread on Linux, set them on every thread of pid
+    tids = [int(tid) for tid in os.listdir(f'/proc/{pid}/task')] if os.path.isdir(f'/proc/{pid}/task') else []
+    return tids or [pid]
+
+
+def pin_process(pid: int, cpus: Sequence[int]) -> None:
+    for tid in _threads(pid):
+        os.sched_setaffinity(tid, cpus)
+
+
+def set_nice(pid: int, nice: int) -> None:
+    for tid in _threads(pid):
+        os.setpriority(os.PRIO_PROCESS, tid, nice)
+
+
+def apply_affinity(affinity: CpuAffinity, player_pid: Optional[int] = None,
+                   driver_pid: Optional[int] = None) -> Dict[str, str]:
+    """Pin the player and driver processes (either may be None) and set the nice
+    level of the player. Returns the settings applied, as strings for the metrics."""
+    if not hasattr(os, 'sched_setaffinity'):
+        print('WARNING: CPU affinity is only supported on Linux, not pinning')
+        return {}
+    applied = {}
+    try:
+        if player_pid is not None and affinity.player_cpus:
+            pin_process(player_pid, affinity.player_cpus)
+            applied['player_cpus'] = format_cpu_list(affinity.player_cpus)
+        if driver_pid is not None and affinity.driver_cpus:
+            pin_process(driver_pid, affinity.driver_cpus)
+            applied['driver_cpus'] = format_cpu_list(affinity.driver_cpus)
+        if player_pid is not None and affinity.nice is not None:
+            set_nice(player_pid, affinity.nice)
+            applied['nice'] = str(affinity.nice)
+    except OSError as e:
+        # e.g. cores outside the cgroup, or a negative nice level without privileges
+        print(f'WARNING: could not apply {affinity}: {e}')
+    return applied
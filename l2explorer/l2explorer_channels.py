@@ -17,145 +17,289 @@ IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
 import json
+import threading
 import time
 import uuid
+from concurrent.futures import Future
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
 from mlagents_envs.side_channel.side_channel import (IncomingMessage,
                                                      OutgoingMessage,
                                                      SideChannel)
 
+# Seconds a request waits for its reply before its future fails with TimeoutError
+DEFAULT_REQUEST_TIMEOUT = 60.0
+# req_token of messages Unity did not send in reply to a request
+NO_REQ_TOKEN = str(uuid.UUID(int=0))
 
-# Create the StringLogChannel class
-class ResetChannel(SideChannel):
-    # Sends json string with reset parameters
-    def __init__(self, debug=False) -> None:
-        super().__init__(uuid.UUID("621f0a70-4f87-11ea-a6bf-784f4387d1f7"))
+
+class SideChannelError(Exception):
+    """Unity answered a request with an error message"""
+    pass
+
+
+class MessageBus(SideChannel):
+    """Base of the L2Explorer json side channels, see docs/Channels.md.
+
+    Every message sent is stamped with a token and returns a Future, which the
+    reply carrying that token as req_token resolves to the reply dict, or fails
+    with SideChannelError on an error reply and TimeoutError once its deadline
+    passed. Replies only arrive while the environment exchanges data with Unity,
+    so several requests queued before one step() are all answered by it.
+    """
+
+    def __init__(self, channel_id: uuid.UUID, debug=False) -> None:
+        super().__init__(channel_id)
         self.debug = debug
-        self.reset = False
+        self._lock = threading.Lock()
+        # Pending requests by token, in the order they were sent, with their deadlines
+        self._pending: Dict[str, Tuple[Future, float]] = {}
+        # Futures waiting for the next unsolicited message of an action
+        self._waiters: Dict[str, List[Tuple[Future, float]]] = {}
+        # No deadline passes before this time, so most messages skip the expiry scan
+        self._next_deadline = float('inf')
+
+    @staticmethod
+    def new_message(action: str) -> dict:
+        return {"token": str(uuid.uuid1()), "action": action,
+                "msg_time": datetime.fromtimestamp(time.time()).strftime('%Y-%m-%dT%H:%M:%S')}
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def request(self, json_data: dict, timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT,
+                reply: bool = True) -> Optional[Future]:
+        """Queue json_data, which must hold a token, and return the Future of its reply.
+        With reply=False the reply is expected but dropped, and None is returned."""
+        future = Future() if reply else None
+        deadline = float('inf') if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._pending[json_data["token"]] = (future, deadline)
+            self._next_deadline = min(self._next_deadline, deadline)
+        msg = OutgoingMessage()
+        msg.write_string(json.dumps(json_data))
+        # We call this method to queue the data we want to send
+        super().queue_message_to_send(msg)
+        return future
+
+    def wait_for(self, action: str, timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT) -> Future:
+        """Future of the next message of action that does not answer a request"""
+        future = Future()
+        deadline = float('inf') if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._waiters.setdefault(action, []).append((future, deadline))
+            self._next_deadline = min(self._next_deadline, deadline)
+        return future
 
     def on_message_received(self, msg: IncomingMessage) -> None:
         """
         Note: We must implement this method of the SideChannel interface to
         receive messages from Unity
-        Should receive and print "Reset Configured" if reset params received
         """
-        # We simply read a string from the message and print it.
-        self.reset = True
-
+        text = msg.read_string()
+        try:
+            data = json.loads(text)
+        except ValueError:
+            # Plain string replies, such as "Reset Configured"
+            data = {"payload": text}
         if self.debug:
-            print(msg.read_string())
+            print(data)
+        self.handle_message(data)
+
+        matched, future = self._match(data)
+        if future is not None:
+            if data.get("action") == "error":
+                _resolve(future, exception=SideChannelError(f'Unity answered {data.get("payload")}'))
+            else:
+                _resolve(future, data)
+        elif not matched:
+            with self._lock:
+                waiters = self._waiters.pop(data.get("action"), [])
+            for waiter, _ in waiters:
+                _resolve(waiter, data)
+        self.expire_requests()
+
+    def handle_message(self, data: dict) -> None:
+        # Called with every message received, before the requests are matched
+        pass
+
+    def _match(self, data: dict) -> Tuple[bool, Optional[Future]]:
+        # Whether data answers a pending request, and the future of that request
+        with self._lock:
+            entry = self._pending.pop(data.get("req_token"), None)
+        return (True, entry[0]) if entry is not None else (False, None)
+
+    def expire_requests(self) -> None:
+        """Fail the futures whose deadline passed with TimeoutError"""
+        now = time.monotonic()
+        if now < self._next_deadline:
+            return
+        expired = []
+        with self._lock:
+            for token, (future, deadline) in list(self._pending.items()):
+                if deadline < now:
+                    if future is not None:
+                        expired.append(future)
+                    del self._pending[token]
+            for action, waiters in list(self._waiters.items()):
+                expired.extend(future for future, deadline in waiters if deadline < now)
+                waiters = [(future, deadline) for future, deadline in waiters if deadline >= now]
+                if waiters:
+                    self._waiters[action] = waiters
+                else:
+                    del self._waiters[action]
+            deadlines = [deadline for _, deadline in self._pending.values()]
+            deadlines += [deadline for waiters in self._waiters.values() for _, deadline in waiters]
+            self._next_deadline = min(deadlines, default=float('inf'))
+        for future in expired:
+            _resolve(future, exception=TimeoutError('No reply from Unity before the request deadline'))
+
+    def cancel_requests(self) -> None:
+        """Cancel every pending future, e.g. when the environment closes"""
+        with self._lock:
+            futures = [future for future, _ in self._pending.values() if future is not None]
+            futures += [future for waiters in self._waiters.values() for future, _ in waiters]
+            self._pending.clear()
+            self._waiters.clear()
+            self._next_deadline = float('inf')
+        for future in futures:
+            future.cancel()
+
+
+def _resolve(future: Future, result=None, exception: Optional[BaseException] = None) -> None:
+    # The caller may have cancelled the future
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+
+# Create the StringLogChannel class
+class ResetChannel(MessageBus):
+    # Sends json string with reset parameters
+    def __init__(self, debug=False) -> None:
+        super().__init__(uuid.UUID("621f0a70-4f87-11ea-a6bf-784f4387d1f7"), debug)
+        # Set when Unity acknowledges the last message sent on this channel, only kept
+        # for the reset property; requests are followed through their futures
+        self.acknowledged = threading.Event()
+
+    @property
+    def reset(self) -> bool:
+        return self.acknowledged.is_set()
+
+    def handle_message(self, data: dict) -> None:
+        # Should receive "Reset Configured" if reset params received. Error replies
+        # fail the future of their request instead
+        if data.get("action") != "error":
+            self.acknowledged.set()
 
-    def send_json(self, data: dict) -> None:
+    def _match(self, data: dict) -> Tuple[bool, Optional[Future]]:
+        # An acknowledgement without req_token answers the oldest request, Unity
+        # handles the messages of a channel in order
+        matched, future = super()._match(data)
+        if not matched and data.get("req_token", NO_REQ_TOKEN) == NO_REQ_TOKEN:
+            with self._lock:
+                if self._pending:
+                    future, _ = self._pending.pop(next(iter(self._pending)))
+                    matched = True
+        return matched, future
+
+    def send_json(self, data: dict, timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT) -> Optional[Future]:
         # Add the string to an OutgoingMessage
         if data.keys() >= {"action", "payload"}:
-            json_data = {}
-            json_data["token"] = str(uuid.uuid1())
-            json_data["action"] = data["action"]
-            json_data["msg_time"] = datetime.fromtimestamp(
-                time.time()).strftime('%Y-%m-%dT%H:%M:%S')
+            json_data = self.new_message(data["action"])
             json_data["payload"] = data["payload"]
 
             #set unique name for spawning objects
             if json_data["action"] == "object_create":
-                if "unique_name" in data:
+                if data.get("unique_name") is not None:
                     json_data["unique_name"] = data["unique_name"]
                 else:
                     json_data["unique_name"] = str(uuid.uuid1())
 
-            msg = OutgoingMessage()
-            msg.write_string(json.dumps(json_data))
-
-            # We call this method to queue the data we want to send
-            self.reset = False
-            super().queue_message_to_send(msg)
+            self.acknowledged.clear()
+            return self.request(json_data, timeout)
         else:
             print(f"Error in creating reset message: action or payload missing")
+            return None
+
+    def send_objects(self, payloads, unique_names) -> None:
+        # One object_create message per object, built in a single pass: the batch
+        # shares its timestamp and derives the tokens from one uuid. The
+        # acknowledgements are matched but no futures are made for them
+        batch = str(uuid.uuid1())
+        msg_time = datetime.fromtimestamp(time.time()).strftime('%Y-%m-%dT%H:%M:%S')
+        for i, (payload, unique_name) in enumerate(zip(payloads, unique_names)):
+            self.request({"token": f"{batch}-{i}", "action": "object_create", "msg_time": msg_time,
+                          "payload": payload, "unique_name": unique_name}, reply=False)
+        self.acknowledged.clear()
+
 
-class DebugChannel(SideChannel):
+class DebugChannel(MessageBus):
     # Builds on ml-agents example side channel
     # Can write messages, which will be recorded in the Unity logs with the From python: prefix
     # Receives error messages from unity, prints with From Unity: prefix
     def __init__(self, debug=False) -> None:
-        super().__init__(uuid.UUID("c5fba0b5-6392-4433-a95f-cdec6b0061e1"))
-        self.debug = debug
-
-    def on_message_received(self, msg: IncomingMessage) -> None:
-        """
-        Note: We must implement this method of the SideChannel interface to
-        receive messages from Unity
-        """
-        # We simply read a string from the message and print it.
-        data = json.loads(msg.read_string())
-
-        if self.debug:
-            print(data)
+        super().__init__(uuid.UUID("c5fba0b5-6392-4433-a95f-cdec6b0061e1"), debug)
 
-    def send_string(self, data: dict) -> None:
+    def send_string(self, data: dict) -> Optional[Future]:
         # Add the string to an OutgoingMessage
         if "action" in data:
-            json_data = {}
-            json_data["token"] = str(uuid.uuid1())
-            json_data["action"] = data["action"]
-            json_data["msg_time"] = datetime.fromtimestamp(
-                time.time()).strftime('%Y-%m-%dT%H:%M:%S')
+            json_data = self.new_message(data["action"])
             if json_data["action"] in ["save_screenshot", "set_debug_categories"]:
                 try:
                     json_data["payload"] = data["payload"]
                 except Exception as e:
                     print("Error in creating debug message: ", e)
-                    return
-
-            msg = OutgoingMessage()
-            msg.write_string(json.dumps(json_data))
-            # We call this method to queue the data we want to send
-            super().queue_message_to_send(msg)
+                    return None
+            return self.request(json_data)
         else:
             print(f"Error in creating debug message: action missing")
+            return None
+
+    def get_debug_categories(self, timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT) -> Future:
+        """Future of the debug_categories reply, its payload lists the categories"""
+        return self.request(self.new_message("get_debug_categories"), timeout)
 
 
-class StateChannel(SideChannel):
+class StateChannel(MessageBus):
     # Allows us to query specific values that were specified in the reset json, and get a response
     # Specified keys must be valid keys in the reset json
     # Defaults to returning all values
     def __init__(self, debug=False) -> None:
-        super().__init__(uuid.UUID("37715121-3bce-45ff-966d-680586560a5d"))
-        self.debug = debug
+        super().__init__(uuid.UUID("37715121-3bce-45ff-966d-680586560a5d"), debug)
         self.state_dict = {}  # empty dictionary of states
 
-    def on_message_received(self, msg: IncomingMessage) -> None:
-        """
-        Note: We must implement this method of the SideChannel interface to
-        receive messages from Unity
-
-        """
-        # Fill dictionary with json
-        data_dict = json.loads(msg.read_string())
-        self.state_dict = data_dict["payload"]
-
-        if self.debug:
-            print(data_dict)
+    def handle_message(self, data: dict) -> None:
+        # Fill dictionary with the state Unity sends every step; replies to
+        # requests (observer_list, ...) are returned through their futures
+        if data.get("action", "state") == "state":
+            self.state_dict = data.get("payload", {})
 
-    def request_keys(self, data: dict) -> None:
+    def request_keys(self, data: dict) -> Optional[Future]:
         # Add the string to an OutgoingMessage
         if "action" in data:
-            json_data = {}
-            json_data["token"] = str(uuid.uuid1())
-            json_data["action"] = data["action"]  # set_active_observers
-            json_data["msg_time"] = datetime.fromtimestamp(
-                time.time()).strftime('%Y-%m-%dT%H:%M:%S')
+            json_data = self.new_message(data["action"])  # set_active_observers
             if json_data["action"] == "set_active_observers":
                 try:
                     json_data["payload"] = {}
                     json_data["payload"]["state"] = data["state"]
                 except Exception as e:
                     print("Error in creating state message: ", e)
-                    return
-
-            # print(json.dumps(json_data))
-            msg = OutgoingMessage()
-            msg.write_string(json.dumps(json_data))
-            # We call this method to queue the data we want to send
-            super().queue_message_to_send(msg)
+                    return None
+            return self.request(json_data)
         else:
-            print(f"Error in creating state message: action missing")        
+            print(f"Error in creating state message: action missing")
+            return None
+
+    def get_observers(self, timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT) -> Future:
+        """Future of the observer_list reply, its payload["state"] lists the observers"""
+        return self.request(self.new_message("get_observers"), timeout)
+
+    def next_state(self, timeout: Optional[float] = DEFAULT_REQUEST_TIMEOUT) -> Future:
+        """Future of the next state message, a snapshot of the active observers"""
+        return self.wait_for("state", timeout)
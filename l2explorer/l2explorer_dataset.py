@@ -0,0 +1,187 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from .l2explorer_recorder import INDEX_FILE, META_FILE, ROW_FIELDS
+
+"""
+Reader of recordings written by L2ExplorerRecorder. Uncompressed chunks are
+memory mapped, so a minibatch only reads the rows it uses; compressed chunks
+are decompressed on first use and kept in a small cache. Only the index is
+loaded up front.
+"""
+
+
+class L2ExplorerDataset(object):
+    """Random access to the transitions (obs, action, reward, next_obs, done) of a
+    recording directory.
+
+    A transition starts at every row whose next row continues the same episode.
+    With num_shards > 1 only the transitions of every num_shards-th chunk, starting
+    at shard_index, belong to this dataset, so dataloader workers read disjoint files.
+    """
+
+    def __init__(self, directory: str, shard_index: int = 0, num_shards: int = 1, cache_chunks: int = 4):
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(f'shard_index must be in [0, {num_shards})')
+        self.directory = directory
+        self.shard_index = shard_index
+        self.num_shards = num_shards
+        with open(os.path.join(directory, META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        self.specs = {name: (tuple(spec['shape']), np.dtype(spec['dtype'])) for name, spec in meta['arrays'].items()}
+        self.observation_keys = tuple(name for name in self.specs if name not in ROW_FIELDS)
+
+        # Chunks and their first global row, in the order they were written
+        self.chunk_names = []
+        self.segments = []
+        chunk_rows = {}
+        with open(os.path.join(directory, INDEX_FILE)) as index_file:
+            for line in index_file:
+                segment = json.loads(line)
+                if segment['chunk'] not in chunk_rows:
+                    self.chunk_names.append(segment['chunk'])
+                    chunk_rows[segment['chunk']] = 0
+                chunk_rows[segment['chunk']] += segment['length']
+                self.segments.append(segment)
+        counts = np.array([chunk_rows[name] for name in self.chunk_names], dtype=np.int64)
+        self._chunk_starts = np.concatenate([[0], np.cumsum(counts)])
+        self.num_rows = int(self._chunk_starts[-1])
+
+        # Episode and step of every row, from the index alone
+        chunk_numbers = {name: i for i, name in enumerate(self.chunk_names)}
+        self._episode = np.empty(self.num_rows, dtype=np.int64)
+        self._step = np.empty(self.num_rows, dtype=np.int64)
+        for segment in self.segments:
+            start = self._chunk_starts[chunk_numbers[segment['chunk']]] + segment['offset']
+            self._episode[start:start + segment['length']] = segment['episode']
+            self._step[start:start + segment['length']] = np.arange(segment['step'], segment['step'] + segment['length'])
+
+        rows = np.arange(self.num_rows - 1)
+        continues = (self._episode[1:] == self._episode[:-1]) & (self._step[1:] == self._step[:-1] + 1)
+        in_shard = (np.searchsorted(self._chunk_starts, rows, side='right') - 1) % num_shards == shard_index
+        self.transitions = rows[continues & in_shard]
+
+        self._cache_chunks = cache_chunks
+        self._cache: 'OrderedDict[int, Dict[str, np.ndarray]]' = OrderedDict()
+        self._mapped: Dict[int, Dict[str, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.transitions)
+
+    def shard(self, shard_index: int, num_shards: int) -> 'L2ExplorerDataset':
+        """The same recording split for dataloader worker shard_index of num_shards"""
+        return L2ExplorerDataset(self.directory, shard_index, num_shards, self._cache_chunks)
+
+    def locate(self, episode: int, step: int) -> Tuple[str, int]:
+        """Chunk file and row offset of (episode, step)"""
+        for segment in self.segments:
+            if segment['episode'] == episode and segment['step'] <= step < segment['step'] + segment['length']:
+                return segment['chunk'], segment['offset'] + step - segment['step']
+        raise KeyError(f'Step {step} of episode {episode} is not in the recording')
+
+    def _chunk(self, number: int) -> Dict[str, np.ndarray]:
+        name = self.chunk_names[number]
+        path = os.path.join(self.directory, name)
+        if not name.endswith('.npz'):
+            # Memory mapped arrays are cheap to keep, only touched pages are read
+            if number not in self._mapped:
+                self._mapped[number] = {key: np.load(os.path.join(path, key + '.npy'), mmap_mode='r')
+                                        for key in self.specs}
+            return self._mapped[number]
+        with self._lock:
+            if number in self._cache:
+                self._cache.move_to_end(number)
+                return self._cache[number]
+        with np.load(path) as npz:
+            arrays = {key: npz[key] for key in self.specs}
+        with self._lock:
+            self._cache[number] = arrays
+            while len(self._cache) > self._cache_chunks:
+                self._cache.popitem(last=False)
+        return arrays
+
+    def gather(self, name: str, rows: np.ndarray) -> np.ndarray:
+        """Array name at the global rows (any shape), reading chunk by chunk"""
+        shape, dtype = self.specs[name]
+        flat_rows = np.asarray(rows, dtype=np.int64).reshape(-1)
+        out = np.empty((len(flat_rows),) + shape, dtype=dtype)
+        chunk_ids = np.searchsorted(self._chunk_starts, flat_rows, side='right') - 1
+        for number in np.unique(chunk_ids):
+            mask = chunk_ids == number
+            out[mask] = self._chunk(number)[name][flat_rows[mask] - self._chunk_starts[number]]
+        return out.reshape(np.shape(rows) + shape)
+
+    def frame_rows(self, rows: np.ndarray, frame_stack: int) -> np.ndarray:
+        """[len(rows), frame_stack] rows ending at rows, oldest first; frames before the
+        start of the episode repeat its first row"""
+        rows = np.asarray(rows, dtype=np.int64)
+        episode_start = rows - self._step[rows]
+        offsets = np.arange(frame_stack - 1, -1, -1)
+        return np.maximum(rows[:, None] - offsets[None, :], episode_start[:, None])
+
+    def get(self, indices: np.ndarray, frame_stack: int = 1) -> Dict[str, object]:
+        """Transitions by index into this dataset. With frame_stack > 1 the observations
+        have an extra axis of the frame_stack most recent frames."""
+        rows = self.transitions[np.asarray(indices)]
+        next_rows = rows + 1
+        if frame_stack > 1:
+            obs_rows, next_obs_rows = self.frame_rows(rows, frame_stack), self.frame_rows(next_rows, frame_stack)
+        else:
+            obs_rows, next_obs_rows = rows, next_rows
+        return {
+            'obs': {key: self.gather(key, obs_rows) for key in self.observation_keys},
+            'action': self.gather('action', rows),
+            'reward': self.gather('reward', next_rows),
+            'next_obs': {key: self.gather(key, next_obs_rows) for key in self.observation_keys},
+            'done': self.gather('done', next_rows),
+        }
+
+    def sample(self, batch_size: int, frame_stack: int = 1,
+               rng: Optional[np.random.Generator] = None) -> Dict[str, object]:
+        rng = rng if rng is not None else np.random.default_rng()
+        return self.get(rng.integers(0, len(self.transitions), batch_size), frame_stack)
+
+    def batches(self, batch_size: int, num_batches: Optional[int] = None, frame_stack: int = 1,
+                prefetch: int = 4, workers: int = 2, seed: Optional[int] = None) -> Iterator[Dict[str, object]]:
+        """Random minibatches, with up to prefetch batches prepared ahead by `workers`
+        threads. Runs forever unless num_batches is given."""
+        if len(self.transitions) == 0:
+            raise ValueError(f'{self.directory} holds no transitions for shard {self.shard_index}')
+        seeds = np.random.SeedSequence(seed)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='l2explorer-dataset') as executor:
+            pending = []
+            produced = 0
+            while num_batches is None or produced < num_batches:
+                while len(pending) < prefetch and (num_batches is None or produced + len(pending) < num_batches):
+                    rng = np.random.default_rng(seeds.spawn(1)[0])
+                    pending.append(executor.submit(self.sample, batch_size, frame_stack, rng))
+                batch = pending.pop(0).result()
+                produced += 1
+                yield batch
+            for future in pending:
+                future.cancel()
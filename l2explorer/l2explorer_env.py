@@ -17,8 +17,14 @@ IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
 import json
+import os
 import sys
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
 from typing import Any, Dict, List, Optional, Tuple, Union
 
 import gym
@@ -26,15 +32,30 @@ import numpy as np
 from gym import error, spaces
 from mlagents_envs.base_env import DecisionSteps, TerminalSteps
 from mlagents_envs.environment import UnityEnvironment
+from mlagents_envs.side_channel.engine_configuration_channel import \
+    EngineConfigurationChannel
 
 from l2explorer.l2explorer_channels import (DebugChannel, ResetChannel,
                                             StateChannel)
 
-from .utils import get_l2explorer_app_location, get_l2explorer_worker_id
+from .l2explorer_affinity import apply_affinity
+from .l2explorer_fake import FakeUnityEnvironment
+from .l2explorer_metrics import MetricsRegistry
+from .l2explorer_objects import ObjectRegistry, SpawnedObject, check_object_spec
+from .l2explorer_obs import (DEPTH_FORMATS, SEMANTIC_HISTOGRAM_KEY,
+                             SEMANTIC_KEYS, SEMANTIC_LABELS_KEY, STATE_KEY,
+                             DepthBuffer, ObservationBuffer, compile_layout,
+                             preprocess_visual, select_cameras)
+from .l2explorer_semantic import N_LABELS, SemanticDecoder
+from .l2explorer_worker_ids import AUTO_WORKER_ID, allocate_worker_id
+from .utils import (get_l2explorer_app_location, get_l2explorer_backend,
+                    get_l2explorer_worker_id)
 
 GymStepResult = Tuple[Dict, float, bool, Dict]
 
 COMMUNICATION_TIMEOUT=10 #timeout in seconds
+# Settings of the engine configuration side channel accepted in engine_config
+ENGINE_SETTINGS = ('time_scale', 'target_frame_rate', 'quality_level', 'capture_frame_rate')
 
 
 class UnityGymException(error.Error):
@@ -44,34 +65,204 @@ class UnityGymException(error.Error):
 
     pass
 
+class L2ExplorerTimeoutError(UnityGymException, TimeoutError):
+    """
+    Unity did not answer within the communication timeout.
+    """
+
+    pass
+
+class L2ExplorerRestartedError(UnityGymException):
+    """
+    Unity did not finish a step within step_timeout. The player was killed and
+    relaunched and the episode restarted with the last reset params; observation
+    is the first observation of the new episode.
+    """
+
+    def __init__(self, message, observation=None):
+        super().__init__(message)
+        self.observation = observation
+
+def resolve_backend(backend=None):
+    """Return the class used to start Unity for backend, which is 'unity', 'fake', a
+    callable taking the UnityEnvironment arguments, or None to read L2EXPLORER_BACKEND."""
+    if backend is None:
+        backend = get_l2explorer_backend()
+    if callable(backend):
+        return backend
+    if backend == 'unity':
+        return UnityEnvironment
+    if backend == 'fake':
+        return FakeUnityEnvironment
+    raise ValueError(f'Unknown L2Explorer backend {backend}')
+
+
+def check_engine_config(engine_config):
+    """Validate a dict of ENGINE_SETTINGS and return a copy"""
+    unknown = set(engine_config) - set(ENGINE_SETTINGS)
+    if unknown:
+        raise ValueError(f'Unknown engine settings {sorted(unknown)}, choose from {ENGINE_SETTINGS}')
+    return dict(engine_config)
+
+
+def needs_player(backend=None):
+    """Whether backend launches the Unity player binary given by L2EXPLORER_APP"""
+    return resolve_backend(backend) is UnityEnvironment
+
+
+class L2ExplorerInstance(object):
+    """A launched Unity player together with the side channels registered with it.
+
+    L2ExplorerTask launches one of these on its first reset(), but an instance can
+    also be launched ahead of time (see L2ExplorerPool) and handed to a task.
+    backend selects what is launched, see resolve_backend.
+    """
+
+    def __init__(self, filename, worker_id, seed, debug=False, backend=None):
+        self.filename = filename
+        self.worker_id = worker_id
+        self.seed = seed
+        self.backend = backend
+        # Settings applied by pin(), reported by the tasks driving this instance
+        self.affinity = None
+        self.reset_channel = ResetChannel(debug)
+        self.debug_channel = DebugChannel(debug)
+        self.state_channel = StateChannel(debug)
+        self.engine_channel = EngineConfigurationChannel()
+        environment_class = resolve_backend(backend)
+        self.env = environment_class(filename, worker_id, seed=seed, side_channels=[
+                                     self.reset_channel, self.debug_channel, self.state_channel,
+                                     self.engine_channel])
+
+    def configure_engine(self, engine_config):
+        # Queued, Unity applies the settings with the next reset or step
+        self.engine_channel.set_configuration_parameters(**check_engine_config(engine_config))
+
+    def is_alive(self):
+        # The player process is only known when it was launched from Python (not in editor mode)
+        if not self.env._loaded:
+            return False
+        proc = getattr(self.env, 'proc1', None)
+        return proc is None or proc.poll() is None
+
+    def close(self):
+        if self.env._loaded:
+            self.env.close()
+        for channel in self.channels:
+            channel.cancel_requests()
+
+    @property
+    def channels(self):
+        """The json side channels, whose requests return futures"""
+        return (self.reset_channel, self.debug_channel, self.state_channel)
+
+    def expire_requests(self):
+        # Fail the side channel requests Unity did not answer in time
+        for channel in self.channels:
+            channel.expire_requests()
+
+    def pin(self, affinity, driver_pid=None):
+        """Apply a CpuAffinity to the player process (if launched from Python) and
+        driver_pid; returns the settings applied"""
+        proc = getattr(self.env, 'proc1', None)
+        self.affinity = apply_affinity(affinity, proc.pid if proc is not None else None, driver_pid)
+        return self.affinity
+
+    def kill(self):
+        # Terminate a player that stopped answering, then release its port
+        proc = getattr(self.env, 'proc1', None)
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+        try:
+            self.close()
+        except Exception as e:
+            print(f'WARNING: error closing killed unity environment {self.worker_id}: {e}')
+
+
 class L2ExplorerTask(gym.Env):
-    #Singleton Implementation of unity environment
-    _env = None
-    _reset_channel = None
-    _debug_channel = None
-    _state_channel = None
-    _env_params = {}
     _MAX_INT = 2147483647  # Max int for Unity ML Seed
-
-    @classmethod
-    def close_env(cls):
-        """Close the Unity environment and reset all environment variables"""
-        if L2ExplorerTask._env:
-            L2ExplorerTask._env.close()
-        L2ExplorerTask._env = None
-        L2ExplorerTask._env_params = {}
+    _DEFAULT_SEED = 1234
+    _INSTRUMENTED_METHODS = (('reset', 'reset'), ('step', 'step'), ('_single_step', 'single_step'),
+                             ('_preprocess_single', 'preprocess'))
+    _TRACED_METHODS = (('reset', 'reset'), ('step', 'step'), ('_single_step', 'convert_observation'))
+    _INSTRUMENTED_CHANNELS = (('reset_channel', 'send_json'), ('debug_channel', 'send_string'),
+                              ('state_channel', 'request_keys'))
+
+    def close_env(self):
+        """Close the Unity environment and reset all environment variables.
+        An instance handed in by the caller is only detached, its owner closes it."""
+        if self._pending_step is not None:
+            self._pending_step.exception()
+            self._pending_step = None
+        if self._communicator is not None:
+            self._communicator.shutdown(wait=True)
+            self._communicator = None
+        if self._watchdog is not None:
+            self._watchdog.shutdown(wait=True)
+            self._watchdog = None
+        if self._instance and self._owns_instance:
+            self._instance.close()
+        self._attach(None)
+        if self._worker_lease is not None:
+            self._worker_lease.release()
+            self._worker_lease = None
+        if self._metrics is not None:
+            self._metrics.flush()
+        self._env_params = {}
 
 
     #DO this in reset to allow seed to be set
-    def __init__(self, debug=False, editor_mode=False, uint8_visual=False):
+    def __init__(self, debug=False, editor_mode=False, uint8_visual=False, worker_id=None,
+                 communication_timeout=COMMUNICATION_TIMEOUT, instance=None, obs_buffers=0,
+                 observation_keys=None, action_repeat=1, max_pool_frames=False, backend=None,
+                 metrics=True, metrics_sink=None, tracer=None, depth_format=None,
+                 step_timeout=None, reset_timeout=None, engine_config=None, cpu_affinity=None,
+                 relaunch=None):
         # call reset() to begin playing
-        self._workerid = get_l2explorer_worker_id()
+        # Each task owns its own Unity instance, so several tasks with distinct
+        # worker ids can be driven from a single Python process
         self.debug = debug
-        if editor_mode:
-            print('INFO: starting L2Explorer in editor mode')
-            self._filename = None
+        self._backend = backend
+        # Timing histograms of the hot paths, see l2explorer_metrics.py. Without metrics
+        # nothing is instrumented and the methods below run unchanged
+        self._metrics = None
+        # Optional ChromeTracer recording the timeline of this task, see l2explorer_trace.py
+        self._tracer = None
+        self._episode = 0
+        # With worker_id='auto' a free id is leased until close_env(), see l2explorer_worker_ids.py
+        self._worker_lease = None
+        self._auto_worker_id = False
+        # Engine settings (time_scale, quality_level, ...) sent to every player this task
+        # attaches to, see set_engine_config
+        self._engine_config = check_engine_config(engine_config or {})
+        # CpuAffinity (l2explorer_affinity.py) applied to every player this task launches
+        # and to this process, its driver
+        self._cpu_affinity = cpu_affinity
+        self._spawned = ObjectRegistry()
+        if instance is not None:
+            self._workerid = instance.worker_id
+            self._filename = instance.filename
+            if backend is None:
+                self._backend = instance.backend
         else:
-            self._filename = get_l2explorer_app_location()
+            if worker_id is None:
+                worker_id = get_l2explorer_worker_id()
+            self._auto_worker_id = worker_id == AUTO_WORKER_ID
+            if self._auto_worker_id:
+                self._worker_lease = allocate_worker_id()
+                worker_id = self._worker_lease.worker_id
+            self._workerid = int(worker_id)
+            if editor_mode:
+                print('INFO: starting L2Explorer in editor mode')
+                self._filename = None
+            elif not needs_player(backend):
+                self._filename = None
+            else:
+                self._filename = get_l2explorer_app_location()
+        self._env_params = {}
+        self._instance = None
+        self._attach(instance)
+        self._owns_instance = instance is None
         self._observation_space = None
         self._action_space = None
         self._seed = None
@@ -80,107 +271,402 @@ class L2ExplorerTask(gym.Env):
         self.use_visual = True  # L2 Explorer uses visual observations be default
         self._allow_multiple_visual_obs = True  # default to one obs for now
         self.uint8_visual = uint8_visual  # default to [0,255] uint8 valued pixels
+        # With obs_buffers=K > 0 the visual observation is one [n_cameras, H, W, C] array
+        # written into a ring of K preallocated buffers instead of a new list of arrays
+        self._obs_buffers = obs_buffers
+        self._obs_buffer = None
+        # With observation_keys (e.g. ['rgb']) the observation is a dict holding only the
+        # selected cameras, by name, and the state; other cameras are not converted at all
+        self._camera_keys = None if observation_keys is None else select_cameras(observation_keys)
+        # 'semantic_labels' and 'semantic_histogram' decode the semantic camera into layer labels
+        self._semantic_keys = tuple(key for key in SEMANTIC_KEYS if key in (observation_keys or ()))
+        self._semantic_decoder = None
+        # With depth_format ('float16' or 'uint16') the depth camera is returned as a
+        # single [H, W, 1] channel of that type instead of three equal float channels
+        if depth_format is not None:
+            if depth_format not in DEPTH_FORMATS:
+                raise ValueError(f'Unknown depth_format {depth_format}, choose from {tuple(DEPTH_FORMATS)}')
+            if self._camera_keys is None or 'depth' not in self._camera_keys:
+                raise ValueError("depth_format needs 'depth' in observation_keys")
+        self._depth_format = depth_format
+        self._depth_buffer = None
+        self._depth_index = None
+        self._converted_cameras = ()
+        self._layout = None
+        # With action_repeat=k every step() holds the action for k Unity frames and sums
+        # their rewards; max_pool_frames returns the pixel-wise max of the last two frames
+        if action_repeat < 1:
+            raise ValueError('action_repeat must be at least 1')
+        self._action_repeat = int(action_repeat)
+        self._max_pool_frames = max_pool_frames
+        self._communication_timeout = communication_timeout
+        self._last_reset_latency = None
+        # Thread running step() for step_async, created on first use
+        self._communicator = None
+        self._pending_step = None
+        # With step_timeout / reset_timeout (seconds) steps and resets run on a watchdog
+        # thread; a player missing the deadline is killed and relaunched, and the last
+        # reset params are replayed
+        self._step_timeout = step_timeout
+        self._reset_timeout = reset_timeout
+        self._watchdog = None
+        self._last_reset_params = None
+        self._restarts = 0
+        # relaunch(instance) replaces a hung instance handed in by the caller and returns
+        # the replacement (see L2ExplorerPool); without it the task kills the instance
+        # and launches a player of its own
+        self._relaunch_instance = relaunch
+        # Watched calls run under a generation; the watchdog retires the generation of
+        # a call it abandons, which may then no longer change task state
+        self._generation = 0
+        self._state_lock = threading.Lock()
+        if metrics:
+            self._metrics = MetricsRegistry({'worker_id': self._workerid}, metrics_sink)
+            for method_name, metric_name in self._INSTRUMENTED_METHODS:
+                self._metrics.instrument(self, method_name, metric_name, step=method_name == 'step')
+        if tracer is not None:
+            self._tracer = tracer
+            tracer.add_track(self._workerid, f'L2Explorer worker {self._workerid}')
+            for method_name, span_name in self._TRACED_METHODS:
+                tracer.instrument(self, method_name, span_name, 'task', self._workerid, self._trace_args)
+        self._instrument_instance(self._instance)
+        self._report_affinity(self._instance)
+
+    @property
+    def worker_id(self):
+        return self._workerid
+
+    @property
+    def instance(self):
+        return self._instance
+
+    @property
+    def metrics(self):
+        """The MetricsRegistry of this task, None if it was created with metrics=False"""
+        return self._metrics
+
+    @property
+    def observation_layout(self):
+        """ObservationLayout compiled at the last reset, None before the first reset"""
+        return self._layout
+
+    @property
+    def observation_space(self):
+        return self._observation_space
+
+    @property
+    def action_space(self):
+        return self._action_space
+
+    @property
+    def restarts(self):
+        """Number of times the watchdog relaunched the Unity player"""
+        return self._restarts
+
+    @property
+    def last_reset_latency(self):
+        """Seconds the last reset() took, from sending the params to the first observation"""
+        return self._last_reset_latency
+
+    @property
+    def engine_config(self):
+        return dict(self._engine_config)
+
+    def set_engine_config(self, **settings):
+        """Change engine settings (time_scale, target_frame_rate, quality_level,
+        capture_frame_rate) between episodes; Unity applies them with the next reset
+        or step. The settings are also sent to players launched later."""
+        self._engine_config.update(check_engine_config(settings))
+        if self._instance is not None:
+            self._instance.configure_engine(settings)
 
     def seed(self, val):
         # integer seed required, convert
         self._seed = int(val) % L2ExplorerTask._MAX_INT
 
-    def spawn_object(selfs, spawn_json, unique_name=None):
+    @property
+    def spawned_objects(self):
+        """ObjectRegistry of the objects spawned since the last reset"""
+        return self._spawned
+
+    def spawn_object(self, spawn_json, unique_name=None):
         # Spawn a new object with the "object_create" message
         # If unique_name is none, a random string name is generated
         # Otherwise, if unique_name is a string, it will be used
-        # Before use, the environment must have been reset at least once to initialize L2explorerTask._env
-        if L2ExplorerTask._env:
-            # Send params, wait for params to be received
-            L2ExplorerTask._reset_channel.send_json(
-                {"action": "object_create", "payload": spawn_json, "unique_name": unique_name})
-        else:
+        # Before use, the environment must have been reset at least once to initialize the Unity environment
+        names = self.spawn_objects([spawn_json], None if unique_name is None else [unique_name])
+        return names[0] if names else None
+
+    def spawn_objects(self, specs, unique_names=None):
+        """Spawn the objects of the object_create payloads in specs (see
+        docs/ResetChannel.md) with the next step and return their unique names.
+        The whole batch is validated before anything is sent; missing names are
+        generated. The objects are recorded in spawned_objects."""
+        if not self._env:
             print('WARNING: Cannot spawn objects until environment initialized')
+            return []
+        specs = list(specs)
+        for spec in specs:
+            check_object_spec(spec)
+        if unique_names is None:
+            unique_names = [None] * len(specs)
+        elif len(unique_names) != len(specs):
+            raise ValueError(f'Got {len(unique_names)} unique names for {len(specs)} objects')
+        # Generated names share one uuid per batch
+        batch = uuid.uuid1().hex
+        unique_names = [f'{batch}_{i}' if name is None else str(name) for i, name in enumerate(unique_names)]
+        seen, repeated = set(), []
+        for name in unique_names:
+            if name in seen or name in self._spawned:
+                repeated.append(name)
+            seen.add(name)
+        if repeated:
+            raise ValueError(f'Object unique names must be unique, {repeated} are already used')
+        self._reset_channel.send_objects(specs, unique_names)
+        self._spawned.add([SpawnedObject(name, spec['class'], tuple(spec.get('coordinates', (0.0, 0.0))), dict(spec))
+                           for name, spec in zip(unique_names, specs)])
+        return unique_names
+
+    def _trace_args(self):
+        return {'worker_id': self._workerid, 'episode': self._episode, 'step': self._stepcount}
+
+    def _instrument_instance(self, instance):
+        # Time the Unity step and the messages received from and sent to Unity on each side channel
+        if instance is None:
+            return
+        for channel_name, send_name in self._INSTRUMENTED_CHANNELS:
+            channel = getattr(instance, channel_name)
+            prefix = f'side_channel.{channel_name[:-len("_channel")]}'
+            if self._metrics is not None:
+                self._metrics.instrument(channel, 'on_message_received', f'{prefix}.receive')
+                self._metrics.instrument(channel, send_name, f'{prefix}.send')
+            if self._tracer is not None:
+                self._tracer.instrument(channel, 'on_message_received', f'{prefix}.receive', 'side_channel',
+                                        self._workerid, self._trace_args)
+                self._tracer.instrument(channel, send_name, f'{prefix}.send', 'side_channel',
+                                        self._workerid, self._trace_args)
+        if self._tracer is not None:
+            self._tracer.instrument(instance.env, 'step', 'UnityEnvironment.step', 'unity',
+                                    self._workerid, self._trace_args)
+
+    def _restore_instance(self, instance):
+        # Remove the wrappers of _instrument_instance, in reverse order
+        if instance is None:
+            return
+        for obj in [instance.env] + [getattr(instance, name) for name, _ in self._INSTRUMENTED_CHANNELS]:
+            if self._tracer is not None:
+                self._tracer.restore(obj)
+            if self._metrics is not None:
+                self._metrics.restore(obj)
+
+    def _attach(self, instance):
+        self._restore_instance(self._instance)
+        self._instance = instance
+        self._instrument_instance(instance)
+        self._env = instance.env if instance else None
+        self._reset_channel = instance.reset_channel if instance else None
+        self._debug_channel = instance.debug_channel if instance else None
+        self._state_channel = instance.state_channel if instance else None
+        if instance:
+            self._env_params['filename'] = instance.filename
+            self._env_params['workerid'] = instance.worker_id
+            if self._engine_config:
+                instance.configure_engine(self._engine_config)
+            self._report_affinity(instance)
+
+    def _report_affinity(self, instance):
+        # Players pinned by their owner (e.g. L2ExplorerPool) report their pinning like
+        # the players this task pins itself. Nothing is reported when nothing could be
+        # pinned, e.g. without a player process
+        if self._metrics is None or instance is None:
+            return
+        if instance.affinity:
+            self._metrics.set_info('cpu_affinity', instance.affinity)
+        else:
+            self._metrics.info.pop('cpu_affinity', None)
 
+    def _launch_env(self, generation=None):
+        # Start a Unity instance for this task, along with its side channels
+        if not self._seed:
+            print('WARNING: seed not set, using default')
+            seed = L2ExplorerTask._DEFAULT_SEED
+        else:
+            seed = self._seed
+        if self._auto_worker_id and self._worker_lease is None:
+            # The id was released by close_env(), lease a new one
+            self._worker_lease = allocate_worker_id()
+            self._workerid = self._worker_lease.worker_id
+        try:
+            instance = L2ExplorerInstance(self._filename, self._workerid, seed, self.debug, self._backend)
+        except:
+            print('ERROR: could not initialize unity environment, are filename correct and workerid not already in use by another unity instance?')
+            raise
+        try:
+            with self._committing(generation):
+                # set seed for procedural generation as well
+                np.random.seed(seed)
+                self._attach(instance)
+                self._owns_instance = True
+                if self._cpu_affinity is not None:
+                    instance.pin(self._cpu_affinity, os.getpid())
+                    self._report_affinity(instance)
+        except UnityGymException:
+            # Launched by a call the watchdog abandoned meanwhile
+            instance.close()
+            raise
+
+    @contextmanager
+    def _committing(self, generation):
+        # Task state is changed under this lock, and by a watched call only while its
+        # generation is current: a call the watchdog abandoned can't touch the task
+        # once its deadline passed. Unwatched calls pass generation None
+        with self._state_lock:
+            if generation is not None and generation != self._generation:
+                raise UnityGymException(
+                    f'Call of generation {generation} was abandoned by the watchdog, dropping its result')
+            yield
+
+    def _retire_generation(self):
+        with self._state_lock:
+            self._generation = self._generation + 1
+
+    def _watched(self, method, arg, timeout):
+        # Run method(arg), on the watchdog thread when a timeout is set
+        if timeout is None:
+            return method(arg)
+        if self._watchdog is None:
+            self._watchdog = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f'l2explorer-watchdog-{self._workerid}')
+        future = self._watchdog.submit(method, arg, self._generation)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            if future.done():
+                raise
+        # From here on the call can't change the task. It may have finished just
+        # before its generation was retired, then its result stands
+        self._retire_generation()
+        if future.done() and future.exception() is None:
+            return future.result()
+        # The thread is stuck in Unity; abandon it with its executor, it fails once
+        # the player is killed. It keeps using the player it started with
+        self._watchdog.shutdown(wait=False)
+        self._watchdog = None
+        raise L2ExplorerTimeoutError(f'Unity environment {self._workerid} did not answer within {timeout} s')
+
+    def _relaunch(self):
+        # Kill the player and detach it, the next reset launches a new one. An instance
+        # handed in by the caller is replaced by its owner when it gave a relaunch callback
+        self._retire_generation()
+        instance = self._instance
+        self._attach(None)
+        self._env_params = {}
+        self._restarts = self._restarts + 1
+        if instance is not None and not self._owns_instance and self._relaunch_instance is not None:
+            self._attach(self._relaunch_instance(instance))
+            return
+        if instance is not None:
+            instance.kill()
+        self._owns_instance = True
 
     def reset(self, params):
+        """Reset the environment with params, a dict in the L2Explorer json format,
+        and return the first observation. With reset_timeout a reset that times out
+        is retried once on a relaunched player."""
+        self._last_reset_params = params
+        if self._reset_timeout is None:
+            return self._reset(params)
+        try:
+            return self._watched(self._reset, params, self._reset_timeout)
+        except L2ExplorerTimeoutError as e:
+            print(f'WARNING: {e} on reset, relaunching')
+            self._relaunch()
+        return self._watched(self._reset, params, self._reset_timeout)
+
+    def _reset(self, params, generation=None):
         # Reset the environment
         #Params is a dict in the L2Explorer json format
         #create here so that we have the seed value set properly
 
-        if not L2ExplorerTask._env:
-            try:
-                if not self._seed:
-                    print('WARNING: seed not set, using default')
-                    L2ExplorerTask._reset_channel = ResetChannel(self.debug)
-                    L2ExplorerTask._debug_channel = DebugChannel(self.debug)
-                    L2ExplorerTask._state_channel = StateChannel(self.debug)
-                    L2ExplorerTask._env = UnityEnvironment(self._filename, self._workerid,
-                                                           seed=1234, side_channels=[L2ExplorerTask._reset_channel, L2ExplorerTask._debug_channel, L2ExplorerTask._state_channel])
-                    # set seed for procedural generation as well
-                    np.random.seed(1234)
-                else:
-                    L2ExplorerTask._reset_channel = ResetChannel(self.debug)
-                    L2ExplorerTask._debug_channel = DebugChannel(self.debug)
-                    L2ExplorerTask._state_channel = StateChannel(self.debug)
-                    L2ExplorerTask._env = UnityEnvironment(self._filename, self._workerid, seed=self._seed, side_channels=[
-                                                           L2ExplorerTask._reset_channel, L2ExplorerTask._debug_channel, L2ExplorerTask._state_channel])
-                    # set seed for procedural generation as well
-                    np.random.seed(self._seed)
-                L2ExplorerTask._env_params['filename'] = self._filename
-                L2ExplorerTask._env_params['workerid'] = self._workerid
-
-            except:
-                print('ERROR: could not initialize unity environment, are filename correct and workerid not already in use by another unity instance?')
-                raise
-        elif L2ExplorerTask._env_params['filename'] != self._filename or L2ExplorerTask._env_params['workerid'] != self._workerid:
+        if not self._env:
+            self._launch_env(generation)
+        elif self._env_params['filename'] != self._filename or self._env_params['workerid'] != self._workerid:
             #recreate environment
-            L2ExplorerTask._env.close()
-            try:
-                if not self._seed:
-                    L2ExplorerTask._reset_channel = ResetChannel(self.debug)
-                    L2ExplorerTask._debug_channel = DebugChannel(self.debug)
-                    L2ExplorerTask._state_channel = StateChannel(self.debug)
-                    print('WARNING: seed not set, using default')
-                    L2ExplorerTask._env = UnityEnvironment(self._filename, self._workerid,
-                                                           seed=1234, side_channels=[L2ExplorerTask._reset_channel, L2ExplorerTask._debug_channel, L2ExplorerTask._state_channel])
-                else:
-                    L2ExplorerTask._reset_channel = ResetChannel(self.debug)
-                    L2ExplorerTask._debug_channel = DebugChannel(self.debug)
-                    L2ExplorerTask._state_channel = StateChannel(self.debug)
-                    L2ExplorerTask._env = UnityEnvironment(self._filename, self._workerid, seed=self._seed, side_channels=[
-                                                           L2ExplorerTask._reset_channel, L2ExplorerTask._debug_channel, L2ExplorerTask._state_channel])
-                L2ExplorerTask._env_params['filename'] = self._filename
-                L2ExplorerTask._env_params['workerid'] = self._workerid
-            except:
-                print('ERROR: could not initialize unity environment, are filename correct and workerid not already in use by another unity instance?')
-                raise
+            self.close_env()
+            self._launch_env(generation)
+        # Until the state is updated below only this player is used, a relaunch
+        # may replace the task's one meanwhile
+        env, reset_channel = self._env, self._reset_channel
        # Take a single step so that the brain information will be sent over
-        if not L2ExplorerTask._env.get_behavior_names():
-            self._env.step()
-
-        self.visual_obs = None
-        self._n_agents = 1 #L2explorer currently supports single agent
+        if not env.get_behavior_names():
+            env.step()
 
         # Check brain configuration
-        if len(self._env.get_behavior_names()) != 1:
+        if len(env.get_behavior_names()) != 1:
             raise UnityGymException(
                 "There can only be one behavior in a UnityEnvironment "
                 "if it is wrapped in a gym."
             )
 
-        self.name = self._env.get_behavior_names()[0]
-        self.group_spec = self._env.get_behavior_spec(self.name)
+        name = env.get_behavior_names()[0]
 
         #Send params, wait for params to be received
-        L2ExplorerTask._reset_channel.send_json(
-            {"action": "reset_environment", "payload": params})
-        time.sleep(0.05)
-        total_time = 0
-        self._env.reset()  # reset, sleep, check for receipt of message
-        time.sleep(0.05)
-
-        while(not L2ExplorerTask._reset_channel.reset):
-            time.sleep(0.001)
-            total_time = total_time + 0.001
-            if(total_time > COMMUNICATION_TIMEOUT):
-                print('Timeout on Unity receipt of reset params')
+        # Side channel messages only arrive during an exchange with Unity, so the
+        # environment is stepped until the reply to the reset request and a valid
+        # observation arrive. Other reset channel messages don't count as the reply
+        start = time.perf_counter()
+        deadline = time.monotonic() + self._communication_timeout
+        acknowledged = reset_channel.send_json(
+            {"action": "reset_environment", "payload": params}, self._communication_timeout)
+        env.reset()
+        decision_step, _ = env.get_steps(name)
+        while not acknowledged.done() or len(decision_step) == 0:
+            if acknowledged.done() and acknowledged.exception() is not None:
                 break
+            if time.monotonic() > deadline:
+                raise L2ExplorerTimeoutError(
+                    f'Timeout on Unity receipt of reset params after {self._communication_timeout} s')
+            env.step()
+            decision_step, _ = env.get_steps(name)
+        error = acknowledged.exception()
+        if isinstance(error, TimeoutError):
+            raise L2ExplorerTimeoutError(
+                f'Timeout on Unity receipt of reset params after {self._communication_timeout} s') from error
+        if error is not None:
+            raise UnityGymException(f'Unity rejected the reset params: {error}') from error
+        # The reset may change the observation shapes, refresh the spec
+        group_spec = env.get_behavior_spec(name)
+        with self._committing(generation):
+            return self._finish_reset(params, name, group_spec, decision_step, start)
+
+    def _finish_reset(self, params, name, group_spec, decision_step, start):
+        # Rebuild the spaces and buffers for the new episode and convert its first observation
+        self.visual_obs = None
+        self._n_agents = 1 #L2explorer currently supports single agent
+        self.name = name
+        self.group_spec = group_spec
+        # Compile where each observation lives for the steps to come
+        self._layout = compile_layout(self.group_spec.observation_shapes, self._camera_keys)
+        # Cameras converted by the default conversion, a compact depth camera is handled apart
+        self._converted_cameras = tuple((key, index) for key, index in zip(
+            self._layout.camera_keys, self._layout.camera_indices)
+            if not (key == 'depth' and self._depth_format))
+        if self._depth_format:
+            self._depth_index = self._layout.camera_indices[self._layout.camera_keys.index('depth')]
+            shape = self._layout.visual_shape
+            if self._depth_buffer is None or not self._depth_buffer.matches(shape, self._depth_format, self._obs_buffers):
+                self._depth_buffer = DepthBuffer(shape, self._depth_format, self._obs_buffers)
+        if self._obs_buffers:
+            n_cameras, shape = len(self._converted_cameras), self._layout.visual_shape
+            if self._obs_buffer is None or not self._obs_buffer.matches(
+                    n_cameras, shape, self.uint8_visual, self._obs_buffers):
+                self._obs_buffer = ObservationBuffer(n_cameras, shape, self.uint8_visual, self._obs_buffers)
+        if self._semantic_keys:
+            if self._layout.semantic_index is None:
+                raise UnityGymException(f'{self._semantic_keys} need the semantic camera, which Unity did not send')
+            shape = self._layout.visual_shape
+            if self._semantic_decoder is None or not self._semantic_decoder.matches(shape, self._obs_buffers):
+                self._semantic_decoder = SemanticDecoder(shape, self._obs_buffers)
         # Reset message now received by Unity
         # Reset environment, get sizes of environment
 
@@ -198,40 +684,57 @@ class L2ExplorerTask(gym.Env):
         #Assume visual observations for now
         shape = self._get_vis_obs_shape()
         if self.uint8_visual:
-            self._observation_space = spaces.Box(
+            camera_space = spaces.Box(
                 0, 255, dtype=np.uint8, shape=shape
             )
         else:
-            self._observation_space = spaces.Box(
+            camera_space = spaces.Box(
                 0, 1.0, dtype=np.float32, shape=shape
             )
+        if self._camera_keys is None:
+            self._observation_space = camera_space
+        else:
+            obs_spaces = {key: camera_space for key in self._layout.camera_keys}
+            if self._depth_format == 'float16':
+                obs_spaces['depth'] = spaces.Box(0, 1.0, dtype=np.float16, shape=self._depth_buffer.shape)
+            elif self._depth_format == 'uint16':
+                obs_spaces['depth'] = spaces.Box(0, 65535, dtype=np.uint16, shape=self._depth_buffer.shape)
+            obs_spaces[STATE_KEY] = spaces.Box(-np.inf, np.inf, dtype=np.float32,
+                                               shape=(self._layout.state_size,))
+            if SEMANTIC_LABELS_KEY in self._semantic_keys:
+                obs_spaces[SEMANTIC_LABELS_KEY] = spaces.Box(0, N_LABELS - 1, dtype=np.uint8, shape=shape[:2])
+            if SEMANTIC_HISTOGRAM_KEY in self._semantic_keys:
+                obs_spaces[SEMANTIC_HISTOGRAM_KEY] = spaces.Box(0, shape[0] * shape[1], dtype=np.int64,
+                                                                shape=(N_LABELS,))
+            self._observation_space = spaces.Dict(obs_spaces)
 
         # Select params for state query
         #If you submit an empty list, no state queries will be generated
         json_data = {}
         json_data["action"] = "set_active_observers"
         json_data["state"] = ["agent_params"]
-        L2ExplorerTask._state_channel.request_keys(json_data)
-        L2ExplorerTask._state_channel.state_dict = params
+        self._state_channel.request_keys(json_data)
+        self._state_channel.state_dict = params
 
         """Resets the state of the environment and returns an initial observation.
         Returns: observation (object): the initial observation of the
         space.
         """
 
+        # The world is rebuilt from params, objects spawned before are gone
+        self._spawned.clear()
         # reset step count
         self.game_over = False
         self._stepcount = 0
         self._maxsteps = params['max_steps']
+        self._episode = self._episode + 1
 
-        decision_step, _ = self._env.get_steps(self.name)
-        # First frame is badly initialized and tilted.
-        # Step once to discard  bad observation
-        res: GymStepResult = self._single_step(decision_step)
-
-        # Now step for first observation of properly initialized enivronment
+        # First observation of the reset environment. It is converted once: a second
+        # conversion of the same decision step gives the same observation and would
+        # take another ring slot, overwriting the observation returned before the reset
         res: GymStepResult = self._single_step(decision_step)
         self._env_info = res
+        self._last_reset_latency = time.perf_counter() - start
         return res[0]
 
     def render(self):
@@ -251,41 +754,96 @@ class L2ExplorerTask(gym.Env):
             reward (float/list) : amount of reward returned after previous action
             done (boolean/list): whether the episode has ended.
             info (dict): contains auxiliary diagnostic information, including BatchedStepResult.
+        With step_timeout, a step Unity does not answer in time raises
+        L2ExplorerRestartedError after the player was relaunched and reset.
         """
+        if self._step_timeout is None:
+            return self._step(action)
+        try:
+            return self._watched(self._step, action, self._step_timeout)
+        except L2ExplorerTimeoutError as e:
+            print(f'WARNING: {e} on step {self._stepcount}, relaunching and replaying the last reset')
+            self._relaunch()
+        observation = self.reset(self._last_reset_params)
+        raise L2ExplorerRestartedError(
+            f'Unity environment {self._workerid} was relaunched after a step timeout', observation)
+
+    def _step(self, action: List[Any], generation=None) -> GymStepResult:
         if not self.game_over:
             spec = self.group_spec
             action = np.array(action).reshape((self._n_agents, spec.action_size))
-            self._env.set_actions(self.name, action)
-
-            step_result = self._env.step()
-
-            #n_agents = step_result.n_agents()
-            #self._check_agents(n_agents)
-            decision_step, terminal_step = self._env.get_steps(self.name)
-            if len(terminal_step) != 0:
-                single_res = self._single_step(terminal_step)
-                # The agent is done
-                self.game_over = True
-                self._stepcount = self._stepcount + 1
-                return single_res
-            else:
-                single_res = self._single_step(decision_step)
-                if self._stepcount > self._maxsteps:
-                    self.game_over = True
-                    single_res = (single_res[0], single_res[1], True, single_res[3])
-                else:
-                    self.game_over = single_res[2]
-                self._stepcount = self._stepcount + 1
-                return single_res
+            reward = np.float32(0)
+            previous_obs, info = None, None
+            # The frames run on this player and step count, a relaunch may replace the
+            # task's ones meanwhile; the task state is updated once Unity answered
+            instance, env = self._instance, self._env
+            stepcount = self._stepcount
+            # With action_repeat the action is held for several frames; every frame
+            # counts towards max_steps, but only the final one is converted
+            for _ in range(self._action_repeat):
+                # mlagents clears the actions after every step, set them for each frame
+                env.set_actions(self.name, action)
+                env.step()
+                decision_step, terminal_step = env.get_steps(self.name)
+                # The frame before the final one, for max_pool_frames
+                previous_obs = info.obs if info is not None else None
+                info = terminal_step if len(terminal_step) != 0 else decision_step
+                reward += info.reward[0]
+                truncated = len(terminal_step) == 0 and stepcount > self._maxsteps
+                stepcount = stepcount + 1
+                if len(terminal_step) != 0 or truncated:
+                    break
+            instance.expire_requests()
+
+            with self._committing(generation):
+                self._stepcount = stepcount
+                if self._max_pool_frames and previous_obs is not None:
+                    self._max_pool(previous_obs, info.obs)
+                #n_agents = step_result.n_agents()
+                #self._check_agents(n_agents)
+                observation, _, done, step_info = self._single_step(info)
+                # The agent is done at a terminal step or when max_steps is exceeded
+                self.game_over = done or truncated
+                return (observation, reward, self.game_over, step_info)
         else:
             print('INFO: step called after max_steps reached is true, reset env')
             return {}, 0, True, {}
 
+    def step_async(self, action: List[Any]) -> None:
+        """Start step(action) on a communicator thread and return immediately, so the
+        caller can work while Unity simulates. Collect the result with step_wait().
+        The environment must not be used in between. With obs_buffers, use a ring of
+        at least 2 so the previous observation is not overwritten by the pending step.
+        """
+        if self._pending_step is not None:
+            raise UnityGymException("step_async called again before step_wait")
+        if self._communicator is None:
+            self._communicator = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f'l2explorer-{self._workerid}')
+        # Copy the action, the caller may reuse its array while the step runs
+        self._pending_step = self._communicator.submit(self.step, np.array(action))
+
+    def step_wait(self, timeout: Optional[float] = None) -> GymStepResult:
+        """Wait for the step started by step_async and return its result."""
+        future = self._pending_step
+        if future is None:
+            raise UnityGymException("step_wait called without step_async")
+        try:
+            return future.result(timeout)
+        finally:
+            # On timeout the step is still running and can be waited for again
+            if future.done():
+                self._pending_step = None
+
     def _single_step(self, info: Union[DecisionSteps, TerminalSteps]) -> GymStepResult:
+        if self._camera_keys is not None:
+            return self._single_step_selected(info)
         if self.use_visual:
             visual_obs = self._get_vis_obs_list(info)
             if len(visual_obs) > 0:
-                if self._allow_multiple_visual_obs:
+                if self._obs_buffer is not None:
+                    self.visual_obs = self._obs_buffer.write(info.obs, self._layout.visual_indices)
+                elif self._allow_multiple_visual_obs:
                     visual_obs_list = []
                     for obs in visual_obs:
                         visual_obs_list.append(self._preprocess_single(obs[0]))
@@ -308,52 +866,66 @@ class L2ExplorerTask(gym.Env):
         done = isinstance(info, TerminalSteps)
         observation = {}
         observation["visual"] = default_observation
-        observation["state"] = self._get_vector_obs(info)[0, 1:40]
+        observation["state"] = self._layout.get_state(info.obs)
         return (observation, info.reward[0], done, {"step": info})
 
-    def _preprocess_single(self, single_visual_obs: np.ndarray) -> np.ndarray:
-        if self.uint8_visual:
-            return (255.0 * single_visual_obs).astype(np.uint8)
+    def _single_step_selected(self, info: Union[DecisionSteps, TerminalSteps]) -> GymStepResult:
+        # Only the cameras chosen with observation_keys are converted
+        layout = self._layout
+        observation = {}
+        if self._obs_buffer is not None:
+            self.visual_obs = self._obs_buffer.write(info.obs, [index for _, index in self._converted_cameras])
+            for i, (key, _) in enumerate(self._converted_cameras):
+                observation[key] = self.visual_obs[i]
         else:
-            return single_visual_obs
+            for key, index in self._converted_cameras:
+                observation[key] = self._preprocess_single(info.obs[index][0])
+            self.visual_obs = list(observation.values())
+        if self._depth_format:
+            observation['depth'] = self._depth_buffer.write(info.obs[self._depth_index][0])
+        observation[STATE_KEY] = layout.get_state(info.obs)
+        if self._semantic_keys:
+            labels = self._semantic_decoder.decode(info.obs[layout.semantic_index][0])
+            if SEMANTIC_LABELS_KEY in self._semantic_keys:
+                observation[SEMANTIC_LABELS_KEY] = labels
+            if SEMANTIC_HISTOGRAM_KEY in self._semantic_keys:
+                observation[SEMANTIC_HISTOGRAM_KEY] = self._semantic_decoder.histogram(labels)
+        done = isinstance(info, TerminalSteps)
+        return (observation, info.reward[0], done, {"step": info})
+
+    def _max_pool(self, previous_obs: List[np.ndarray], obs: List[np.ndarray]) -> None:
+        # Max over the last two frames of the cameras that will be converted. mlagents
+        # builds new arrays every step, so the final frame is pooled in place. The
+        # semantic camera keeps the last frame, the max of two palette colors is not
+        # a palette color
+        indices = self._layout.camera_indices if self._camera_keys is not None else self._layout.visual_indices
+        for i in indices:
+            if i != self._layout.semantic_index:
+                np.maximum(previous_obs[i], obs[i], out=obs[i])
+
+    def _preprocess_single(self, single_visual_obs: np.ndarray) -> np.ndarray:
+        return preprocess_visual(single_visual_obs, self.uint8_visual)
 
     def _get_n_vis_obs(self) -> int:
-        result = 0
-        for shape in self.group_spec.observation_shapes:
-            if len(shape) == 3:
-                result += 1
-        return result
+        return len(self._layout.visual_indices)
 
     def _get_vis_obs_shape(self) -> Optional[Tuple]:
-        for shape in self.group_spec.observation_shapes:
-            if len(shape) == 3:
-                return shape
-        return None
+        return self._layout.visual_shape
 
     def _get_vis_obs_list(
         self, step_result: Union[DecisionSteps, TerminalSteps]
     ) -> List[np.ndarray]:
-        result: List[np.ndarray] = []
-        for obs in step_result.obs:
-            if len(obs.shape) == 4:
-                result.append(obs)
-        return result
+        obs = step_result.obs
+        return [obs[i] for i in self._layout.visual_indices]
 
     def _get_vector_obs(
         self, step_result: Union[DecisionSteps, TerminalSteps]
     ) -> np.ndarray:
-        result: List[np.ndarray] = []
-        for obs in step_result.obs:
-            if len(obs.shape) == 2:
-                result.append(obs)
-        return np.concatenate(result, axis=1)
+        obs = step_result.obs
+        return np.concatenate([obs[i] for i in self._layout.vector_indices], axis=1)
 
     def _get_vec_obs_size(self) -> int:
-        result = 0
-        for shape in self.group_spec.observation_shapes:
-            if len(shape) == 1:
-                result += shape[0]
-        return result
+        return self._layout.vector_size
 
     def _check_agents(self, n_agents: int) -> None:
         if self._n_agents > 1:
@@ -0,0 +1,303 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+import math
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from mlagents_envs.base_env import (ActionType, BaseEnv, BehaviorSpec,
+                                    DecisionSteps, TerminalSteps)
+from mlagents_envs.exception import UnityActionException, UnityEnvironmentException
+from mlagents_envs.side_channel.incoming_message import IncomingMessage
+from mlagents_envs.side_channel.outgoing_message import OutgoingMessage
+from mlagents_envs.side_channel.side_channel import SideChannel
+
+from .l2explorer_semantic import LAYER_COLORS, object_layer
+
+"""
+In-process stand-in for the L2Explorer Unity player. It implements the part of
+the mlagents UnityEnvironment API used by L2ExplorerTask, answers the Reset,
+Debug and State side channels, and renders cheap synthetic observations from
+the reset json. It is meant for benchmarking and testing the Python layer, not
+for training agents.
+"""
+
+BEHAVIOR_NAME = 'L2ExplorerAgent?team=0'
+RESET_CHANNEL_ID = uuid.UUID("621f0a70-4f87-11ea-a6bf-784f4387d1f7")
+DEBUG_CHANNEL_ID = uuid.UUID("c5fba0b5-6392-4433-a95f-cdec6b0061e1")
+STATE_CHANNEL_ID = uuid.UUID("37715121-3bce-45ff-966d-680586560a5d")
+ENGINE_CHANNEL_ID = uuid.UUID("e951342c-4f7e-11ea-b238-784f4387d1f7")
+
+DEBUG_CATEGORIES = ["agent", "communications", "worldmaker", "academy"]
+OBSERVERS = ["agent_params", "environment_params", "objects", "game_mode"]
+
+DEFAULT_OBSERVATION_SIZE = 84
+VECTOR_OBSERVATION_SIZE = 5  # interaction object id, x, y, heading, linear velocity
+TIME_STEP = 0.1  # simulated seconds per step
+COLLIDE_DISTANCE = 1.0
+
+
+def _msg_time():
+    return datetime.fromtimestamp(time.time()).strftime('%Y-%m-%dT%H:%M:%S')
+
+
+class FakeUnityEnvironment(BaseEnv):
+    """Pure-Python stand-in for mlagents_envs.environment.UnityEnvironment.
+
+    Accepts the UnityEnvironment constructor arguments (file_name and the launch
+    options are ignored) plus step_latency, the number of seconds each step()
+    and reset() sleeps to emulate the Unity round-trip.
+    """
+
+    def __init__(self, file_name: Optional[str] = None, worker_id: int = 0,
+                 base_port: Optional[int] = None, seed: int = 0, no_graphics: bool = False,
+                 timeout_wait: int = 60, args: Optional[List[str]] = None,
+                 side_channels: Optional[List[SideChannel]] = None, step_latency: float = 0.0):
+        self.worker_id = worker_id
+        self.step_latency = step_latency
+        self.side_channels: Dict[uuid.UUID, SideChannel] = {}
+        for channel in side_channels or []:
+            if channel.channel_id in self.side_channels:
+                raise UnityEnvironmentException(
+                    f'There cannot be two side channels with the same channel id {channel.channel_id}.')
+            self.side_channels[channel.channel_id] = channel
+        self.engine_config: Dict[int, float] = {}
+        self.proc1 = None
+        self._rng = np.random.RandomState(seed)
+        self._loaded = True
+        self._is_first_message = True
+        self._active_observers: List[str] = []
+        self._action: Optional[np.ndarray] = None
+        self._configure({})
+
+    # -- world simulation --------------------------------------------------
+
+    def _configure(self, params: dict) -> None:
+        self._params = params
+        agent_params = params.get('agent_params', {})
+        self._obs_size = int(agent_params.get('observation_size', DEFAULT_OBSERVATION_SIZE))
+        self._max_steps = int(params.get('max_steps', 0))
+        self._max_linear = float(agent_params.get('max_linear_speed', 10.0))
+        self._max_angular = float(agent_params.get('max_angular_speed', 90.0))
+        self._x, self._y = [float(c) for c in agent_params.get('coordinates', [0.0, 0.0])]
+        self._heading = float(agent_params.get('heading', 0.0))
+        self._velocity = 0.0
+        self._objects = {}
+        for i, obj in enumerate(params.get('objects', [])):
+            if obj.get('class'):
+                self._objects[f'object_{i}'] = dict(obj)
+        self._step_count = 0
+        self._spec = BehaviorSpec([(self._obs_size, self._obs_size, 3)] * 3 + [(VECTOR_OBSERVATION_SIZE,)],
+                                  ActionType.CONTINUOUS, 3)
+        self._render_static()
+
+    def _render_static(self) -> None:
+        # Images are rendered once per reset; steps only copy them, like the
+        # decoding of freshly received images does for the real player
+        size = self._obs_size
+        rows = np.linspace(0.0, 1.0, size, dtype=np.float32)[:, None, None]
+        self._depth = np.repeat(np.repeat(rows, size, axis=1), 3, axis=2)
+        self._rgb = self._rng.random_sample((size, size, 3)).astype(np.float32)
+        semantic = np.empty((size, size, 3), dtype=np.float32)
+        semantic[:size // 2] = LAYER_COLORS['skybox']
+        semantic[size // 2:] = LAYER_COLORS['default']
+        objects = list(self._objects.values())
+        if objects:
+            band = max(1, size // (2 * len(objects)))
+            for i, obj in enumerate(objects):
+                col = (2 * i * band) % size
+                semantic[size // 4:, col:col + band] = LAYER_COLORS[object_layer(obj)]
+        self._semantic = semantic
+
+    def _advance(self, action: Optional[np.ndarray]) -> Tuple[float, int]:
+        if action is not None:
+            linear = float(np.clip(action[0, 0], -self._max_linear, self._max_linear))
+            angular = float(np.clip(action[0, 1], -self._max_angular, self._max_angular))
+        else:
+            linear, angular = 0.0, 0.0
+        self._heading = (self._heading + angular * TIME_STEP) % 360.0
+        self._velocity = linear
+        self._x += math.sin(math.radians(self._heading)) * linear * TIME_STEP
+        self._y += math.cos(math.radians(self._heading)) * linear * TIME_STEP
+        reward, collected = 0.0, 0
+        for name, obj in list(self._objects.items()):
+            ox, oy = obj.get('coordinates', [0.0, 0.0])
+            if math.hypot(ox - self._x, oy - self._y) < COLLIDE_DISTANCE:
+                reward += float(obj.get('reward', 0.0))
+                collected = 1 + list(self._objects).index(name)
+                if obj.get('destroy_stimulus'):
+                    del self._objects[name]
+        return reward, collected
+
+    def _observations(self, collected: int) -> List[np.ndarray]:
+        vector = np.array([[collected, self._x, self._y, self._heading, self._velocity]], dtype=np.float32)
+        return [self._depth[None].copy(), self._rgb[None].copy(), self._semantic[None].copy(), vector]
+
+    def _empty_obs(self) -> List[np.ndarray]:
+        # DecisionSteps.empty/TerminalSteps.empty use np.bool, which newer numpy removed
+        return [np.zeros((0,) + tuple(shape), dtype=np.float32) for shape in self._spec.observation_shapes]
+
+    def _update_state(self, reward: float, collected: int) -> None:
+        obs = self._observations(collected)
+        agent_id = np.array([0], dtype=np.int32)
+        rewards = np.array([reward], dtype=np.float32)
+        if self._max_steps and self._step_count >= self._max_steps:
+            empty = DecisionSteps(self._empty_obs(), np.zeros(0, dtype=np.float32),
+                                  np.zeros(0, dtype=np.int32), None)
+            self._state = (empty, TerminalSteps(obs, rewards, np.array([True]), agent_id))
+        else:
+            empty = TerminalSteps(self._empty_obs(), np.zeros(0, dtype=np.float32),
+                                  np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int32))
+            self._state = (DecisionSteps(obs, rewards, agent_id, None), empty)
+
+    # -- side channels -----------------------------------------------------
+
+    def _reply(self, channel_id: uuid.UUID, data: dict) -> None:
+        channel = self.side_channels.get(channel_id)
+        if channel is None:
+            return
+        msg = OutgoingMessage()
+        msg.write_string(json.dumps(data))
+        channel.on_message_received(IncomingMessage(bytes(msg.buffer)))
+
+    def _response(self, request: dict, action: str, payload=None) -> dict:
+        data = {"token": str(uuid.uuid4()), "req_token": request.get("token", str(uuid.UUID(int=0))),
+                "msg_time": _msg_time(), "action": action}
+        if payload is not None:
+            data["payload"] = payload
+        return data
+
+    def _process_side_channels(self) -> None:
+        for channel_id, channel in self.side_channels.items():
+            messages, channel.message_queue = channel.message_queue, []
+            for message in messages:
+                if channel_id == ENGINE_CHANNEL_ID:
+                    self._handle_engine(IncomingMessage(bytes(message)))
+                    continue
+                request = json.loads(IncomingMessage(bytes(message)).read_string())
+                if channel_id == RESET_CHANNEL_ID:
+                    self._handle_reset(request)
+                elif channel_id == DEBUG_CHANNEL_ID:
+                    self._handle_debug(request)
+                elif channel_id == STATE_CHANNEL_ID:
+                    self._handle_state(request)
+
+    def _handle_engine(self, msg: IncomingMessage) -> None:
+        config_type = msg.read_int32()
+        # time scale is the only float field of the engine configuration channel
+        self.engine_config[config_type] = msg.read_float32() if config_type == 2 else msg.read_int32()
+
+    def _handle_reset(self, request: dict) -> None:
+        action = request.get("action")
+        if action == "reset_environment":
+            self._configure(request.get("payload", {}))
+        elif action == "object_create":
+            self._objects[request.get("unique_name") or str(uuid.uuid1())] = dict(request.get("payload", {}))
+        self._reply(RESET_CHANNEL_ID, self._response(request, "ack", "Reset Configured"))
+
+    def _handle_debug(self, request: dict) -> None:
+        if request.get("action") == "get_debug_categories":
+            self._reply(DEBUG_CHANNEL_ID, self._response(request, "debug_categories", DEBUG_CATEGORIES))
+
+    def _handle_state(self, request: dict) -> None:
+        action = request.get("action")
+        if action == "get_observers":
+            self._reply(STATE_CHANNEL_ID, self._response(request, "observer_list", {"state": OBSERVERS}))
+        elif action == "set_active_observers":
+            self._active_observers = list(request.get("payload", {}).get("state", []))
+            self._reply(STATE_CHANNEL_ID, self._response(request, "set_active_observers", {"state": self._active_observers}))
+
+    def _send_state(self) -> None:
+        if not self._active_observers:
+            return
+        state = {}
+        if "agent_params" in self._active_observers:
+            agent_params = dict(self._params.get("agent_params", {}))
+            agent_params["coordinates"] = [self._x, self._y]
+            agent_params["heading"] = self._heading
+            state["agent_params"] = agent_params
+        if "environment_params" in self._active_observers:
+            state["environment_params"] = self._params.get("environment_params", {})
+        if "objects" in self._active_observers:
+            state["objects"] = list(self._objects.values())
+        if "game_mode" in self._active_observers:
+            state["game_mode"] = self._params.get("game_mode", "learn")
+        self._reply(STATE_CHANNEL_ID, self._response({}, "state", state))
+
+    # -- UnityEnvironment API ----------------------------------------------
+
+    def _exchange(self, action: Optional[np.ndarray]) -> None:
+        if not self._loaded:
+            raise UnityEnvironmentException("No Unity environment is loaded.")
+        if self.step_latency:
+            time.sleep(self.step_latency)
+        self._process_side_channels()
+        reward, collected = self._advance(action)
+        self._update_state(reward, collected)
+        self._send_state()
+
+    def reset(self) -> None:
+        self._process_side_channels()
+        self._step_count = 0
+        self._exchange(None)
+        self._is_first_message = False
+        self._action = None
+
+    def step(self) -> None:
+        if self._is_first_message:
+            return self.reset()
+        self._step_count += 1
+        action, self._action = self._action, None
+        self._exchange(action)
+
+    def get_behavior_names(self):
+        return [BEHAVIOR_NAME] if not self._is_first_message else []
+
+    def _assert_behavior_exists(self, behavior_name: str) -> None:
+        if behavior_name != BEHAVIOR_NAME or self._is_first_message:
+            raise UnityActionException(
+                f"The group {behavior_name} does not correspond to an existing agent group in the environment")
+
+    def set_actions(self, behavior_name: str, action: np.ndarray) -> None:
+        self._assert_behavior_exists(behavior_name)
+        expected_shape = (len(self._state[0]), self._spec.action_size)
+        if action.shape != expected_shape:
+            raise UnityActionException(
+                f"The behavior {behavior_name} needs an input of dimension {expected_shape} "
+                f"but received input of dimension {action.shape}")
+        self._action = action.astype(np.float32, copy=False)
+
+    def set_action_for_agent(self, behavior_name: str, agent_id: int, action: np.ndarray) -> None:
+        self.set_actions(behavior_name, np.asarray(action).reshape(1, -1))
+
+    def get_steps(self, behavior_name: str) -> Tuple[DecisionSteps, TerminalSteps]:
+        self._assert_behavior_exists(behavior_name)
+        return self._state
+
+    def get_behavior_spec(self, behavior_name: str) -> BehaviorSpec:
+        self._assert_behavior_exists(behavior_name)
+        return self._spec
+
+    def close(self) -> None:
+        if not self._loaded:
+            raise UnityEnvironmentException("No Unity environment is loaded.")
+        self._loaded = False
@@ -0,0 +1,224 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+"""
+Timing metrics of the L2ExplorerTask hot paths. Instrumented methods are
+shadowed on their instance by a timed wrapper, so a task without metrics runs
+its methods unchanged. Every step() hands the registry to a sink, which can
+log it or export it.
+"""
+
+_MISSING = object()
+
+
+def shadow(obj: Any, method_name: str, wrapper: Any) -> Any:
+    """Set wrapper as an instance attribute over obj.method_name and return what
+    it replaced, for unshadow. Wrappers must be removed in reverse order."""
+    previous = vars(obj).get(method_name, _MISSING)
+    setattr(obj, method_name, wrapper)
+    return previous
+
+
+def unshadow(obj: Any, method_name: str, previous: Any) -> None:
+    if previous is _MISSING:
+        delattr(obj, method_name)
+    else:
+        setattr(obj, method_name, previous)
+
+
+# Upper bounds of the histogram buckets in seconds, the last bucket is unbounded
+DEFAULT_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+                   1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+    """Count, sum, min, max and bucket counts of observed durations in seconds."""
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.bucket_counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.bucket_counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def cumulative_buckets(self) -> List[Tuple[float, int]]:
+        """(upper bound, number of observations <= bound) pairs, ending with inf"""
+        buckets, total = [], 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.bucket_counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'min': self.min if self.count else 0.0,
+            'max': self.max,
+            'buckets': dict(self.cumulative_buckets()),
+        }
+
+
+class MetricsSink(object):
+    """Receives the registry after every step. The default sink does nothing."""
+
+    def on_step(self, registry: 'MetricsRegistry') -> None:
+        pass
+
+    def flush(self, registry: 'MetricsRegistry') -> None:
+        # Called when the task closes its environment
+        pass
+
+
+class LogSink(MetricsSink):
+    """Print the mean and max of every metric every `every` steps."""
+
+    def __init__(self, every: int = 1000):
+        self.every = every
+        self._steps = 0
+
+    def on_step(self, registry: 'MetricsRegistry') -> None:
+        self._steps += 1
+        if self._steps % self.every == 0:
+            self.flush(registry)
+
+    def flush(self, registry: 'MetricsRegistry') -> None:
+        summary = ', '.join(f'{name} {1000 * h.sum / h.count:.2f}/{1000 * h.max:.2f} ms'
+                            for name, h in sorted(registry.histograms.items()) if h.count)
+        print(f'INFO: L2Explorer {registry.labels} metrics (mean/max): {summary}')
+
+
+class PrometheusFileSink(MetricsSink):
+    """Write the registry in the Prometheus text format every `every` steps, for
+    the textfile collector of node_exporter. The file is replaced atomically."""
+
+    def __init__(self, path: str, every: int = 100):
+        self.path = path
+        self.every = every
+        self._steps = 0
+
+    def on_step(self, registry: 'MetricsRegistry') -> None:
+        self._steps += 1
+        if self._steps % self.every == 0:
+            self.flush(registry)
+
+    def flush(self, registry: 'MetricsRegistry') -> None:
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as prom_file:
+            prom_file.write(registry.to_prometheus())
+        os.replace(tmp_path, self.path)
+
+
+class MetricsRegistry(object):
+    """Histograms of the instrumented methods by metric name, plus the sink they
+    are reported to. labels (e.g. the worker id) are attached to exported metrics."""
+
+    def __init__(self, labels: Optional[Dict[str, Any]] = None, sink: Optional[MetricsSink] = None):
+        self.labels = dict(labels or {})
+        self.sink = sink if sink is not None else MetricsSink()
+        self.histograms: Dict[str, Histogram] = {}
+        # Settings reported alongside the histograms, e.g. the CPU pinning applied
+        self.info: Dict[str, Dict[str, str]] = {}
+        self._instrumented: List[Tuple[Any, str, Any]] = []
+
+    def histogram(self, name: str) -> Histogram:
+        if name not in self.histograms:
+            self.histograms[name] = Histogram()
+        return self.histograms[name]
+
+    def set_info(self, name: str, values: Dict[str, Any]) -> None:
+        """Report values (strings) under name, exported as an info metric"""
+        self.info[name] = {key: str(value) for key, value in values.items()}
+
+    def instrument(self, obj: Any, method_name: str, metric_name: str, step: bool = False) -> None:
+        """Time every call of obj.method_name into the histogram metric_name. With
+        step=True each call also counts as a step for the sink."""
+        method = getattr(obj, method_name)
+        observe = self.histogram(metric_name).observe
+        sink, registry = self.sink, self
+
+        if step:
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    observe(time.perf_counter() - start)
+                    sink.on_step(registry)
+        else:
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    observe(time.perf_counter() - start)
+        self._instrumented.append((obj, method_name, shadow(obj, method_name, timed)))
+
+    def restore(self, obj: Any) -> None:
+        """Remove the timed wrappers installed on obj"""
+        for instrumented in reversed([entry for entry in self._instrumented if entry[0] is obj]):
+            unshadow(*instrumented)
+            self._instrumented.remove(instrumented)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Count, sum, mean, min, max and cumulative buckets of every metric, in seconds"""
+        return {name: histogram.snapshot() for name, histogram in self.histograms.items()}
+
+    def reset(self) -> None:
+        for name in self.histograms:
+            self.histograms[name] = Histogram(self.histograms[name].bounds)
+
+    def flush(self) -> None:
+        self.sink.flush(self)
+
+    def to_prometheus(self, prefix: str = 'l2explorer') -> str:
+        lines = []
+        labels = ','.join(f'{key}="{value}"' for key, value in sorted(self.labels.items()))
+        for name, histogram in sorted(self.histograms.items()):
+            metric = f'{prefix}_{name.replace(".", "_")}_seconds'
+            lines.append(f'# TYPE {metric} histogram')
+            for bound, count in histogram.cumulative_buckets():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_labels = f'{labels},le="{le}"' if labels else f'le="{le}"'
+                lines.append(f'{metric}_bucket{{{bucket_labels}}} {count}')
+            suffix = f'{{{labels}}}' if labels else ''
+            lines.append(f'{metric}_sum{suffix} {histogram.sum}')
+            lines.append(f'{metric}_count{suffix} {histogram.count}')
+        for name, values in sorted(self.info.items()):
+            metric = f'{prefix}_{name.replace(".", "_")}_info'
+            pairs = [f'{key}="{value}"' for key, value in sorted(values.items())]
+            info_labels = ','.join(([labels] if labels else []) + pairs)
+            lines.append(f'# TYPE {metric} gauge')
+            lines.append(f'{metric}{{{info_labels}}} 1')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,99 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+from numbers import Real
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+"""
+Objects spawned during an episode with the "object_create" message (see
+docs/ResetChannel.md), and the Python-side registry of what was spawned.
+"""
+
+# Bounds of the object fields given in docs/ResetChannel.md
+COORDINATE_LIMIT = 300.0
+
+
+class SpawnedObject(NamedTuple):
+    unique_name: str
+    object_class: str
+    coordinates: Tuple[float, float]
+    payload: dict
+
+
+def check_object_spec(spec: dict) -> None:
+    """Raise ValueError if Unity would skip or misread the object_create payload spec"""
+    if not isinstance(spec, dict):
+        raise ValueError(f'Object spec must be a dict, got {type(spec).__name__}')
+    object_class = spec.get('class')
+    if not isinstance(object_class, str) or not object_class:
+        raise ValueError(f'Object spec needs a class, got {spec}')
+    coordinates = spec.get('coordinates', [0.0, 0.0])
+    if (not isinstance(coordinates, (list, tuple)) or len(coordinates) != 2 or not all(isinstance(c, Real) for c in coordinates)
+            or any(abs(c) > COORDINATE_LIMIT for c in coordinates)):
+        raise ValueError(f'Object coordinates must be 2 numbers in [-{COORDINATE_LIMIT}, {COORDINATE_LIMIT}], '
+                         f'got {coordinates}')
+    color = spec.get('color', [0.0, 0.0, 0.0])
+    if not isinstance(color, (list, tuple)) or len(color) != 3 or not all(isinstance(c, Real) and 0.0 <= c <= 1.0 for c in color):
+        raise ValueError(f'Object color must be 3 numbers in [0, 1], got {color}')
+
+
+class ObjectRegistry(object):
+    """Objects spawned since the last reset, by unique name. Objects Unity destroyed
+    since (e.g. collected targets) are still listed; ask the StateChannel for those."""
+
+    def __init__(self):
+        self._objects: Dict[str, SpawnedObject] = {}
+        self._positions: Optional[np.ndarray] = None
+
+    def add(self, objects: Sequence[SpawnedObject]) -> None:
+        for obj in objects:
+            self._objects[obj.unique_name] = obj
+        self._positions = None
+
+    def clear(self) -> None:
+        self._objects.clear()
+        self._positions = None
+
+    def __contains__(self, unique_name: str) -> bool:
+        return unique_name in self._objects
+
+    def __getitem__(self, unique_name: str) -> SpawnedObject:
+        return self._objects[unique_name]
+
+    def __iter__(self) -> Iterator[SpawnedObject]:
+        return iter(self._objects.values())
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    def by_class(self, object_class: str) -> List[SpawnedObject]:
+        # Classes are case-insensitive in Unity
+        object_class = object_class.lower()
+        return [obj for obj in self._objects.values() if obj.object_class.lower() == object_class]
+
+    def within(self, center: Sequence[float], radius: float) -> List[SpawnedObject]:
+        """Objects spawned within radius of the (x, y) center"""
+        objects = list(self._objects.values())
+        if not objects:
+            return []
+        if self._positions is None:
+            self._positions = np.array([obj.coordinates for obj in objects], dtype=np.float64)
+        distances = np.hypot(*(self._positions - np.asarray(center, dtype=np.float64)).T)
+        return [objects[i] for i in np.flatnonzero(distances <= radius)]
@@ -0,0 +1,219 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+"""
+Conversion of the visual observations received from Unity. Unity sends each
+camera as a float image in [0, 1] with a leading agent dimension.
+"""
+
+# Visual observations in the order Unity sends them
+CAMERA_NAMES = ('depth', 'rgb', 'semantic')
+STATE_KEY = 'state'
+# Observations derived from the semantic camera, see l2explorer_semantic.py
+SEMANTIC_LABELS_KEY = 'semantic_labels'
+SEMANTIC_HISTOGRAM_KEY = 'semantic_histogram'
+SEMANTIC_KEYS = (SEMANTIC_LABELS_KEY, SEMANTIC_HISTOGRAM_KEY)
+# The state is this slice of the concatenated vector observations
+STATE_START, STATE_STOP = 1, 40
+
+
+def select_cameras(observation_keys: Sequence[str]) -> Tuple[str, ...]:
+    """Validate observation_keys and return the selected camera names in Unity order."""
+    unknown = set(observation_keys) - set(CAMERA_NAMES) - {STATE_KEY} - set(SEMANTIC_KEYS)
+    if unknown:
+        raise ValueError(f'Unknown observation keys {sorted(unknown)}, choose from {CAMERA_NAMES + SEMANTIC_KEYS}')
+    return tuple(name for name in CAMERA_NAMES if name in observation_keys)
+
+
+class ObservationLayout(NamedTuple):
+    """Where each part of the observation lives in DecisionSteps.obs.
+
+    Compiled once per reset from the behavior spec, so steps can index the
+    observations directly instead of scanning them.
+    """
+    visual_indices: Tuple[int, ...]  # positions of all visual observations
+    visual_shape: Optional[Tuple[int, ...]]  # [H, W, C] of a camera
+    camera_keys: Tuple[str, ...]  # cameras returned to the agent
+    camera_indices: Tuple[int, ...]  # their positions in DecisionSteps.obs
+    vector_indices: Tuple[int, ...]  # positions of the vector observations
+    vector_size: int  # length of the concatenated vector observations
+    state_index: Optional[int]  # vector observation holding the whole state, None if it spans several
+    state_slice: slice  # the state within that observation (or within the concatenation)
+    state_size: int
+    semantic_index: Optional[int]  # position of the semantic camera, None without one
+
+    def get_state(self, obs: Sequence[np.ndarray]) -> np.ndarray:
+        """The state vector of the first agent, a view unless it spans several observations."""
+        if self.state_index is not None:
+            return obs[self.state_index][0, self.state_slice]
+        return np.concatenate([obs[i] for i in self.vector_indices], axis=1)[0, self.state_slice]
+
+
+def compile_layout(observation_shapes: Sequence[Tuple[int, ...]],
+                   camera_keys: Optional[Sequence[str]] = None) -> ObservationLayout:
+    """Build the ObservationLayout of a behavior spec. camera_keys are the cameras
+    to return, as validated by select_cameras; None selects every camera."""
+    visual_indices = tuple(i for i, shape in enumerate(observation_shapes) if len(shape) == 3)
+    vector_indices = tuple(i for i, shape in enumerate(observation_shapes) if len(shape) == 1)
+    visual_shape = tuple(observation_shapes[visual_indices[0]]) if visual_indices else None
+
+    if camera_keys is None:
+        camera_keys = tuple(CAMERA_NAMES[i] if i < len(CAMERA_NAMES) else f'camera_{i}'
+                            for i in range(len(visual_indices)))
+        camera_indices = visual_indices
+    else:
+        camera_keys = tuple(key for key in camera_keys if CAMERA_NAMES.index(key) < len(visual_indices))
+        camera_indices = tuple(visual_indices[CAMERA_NAMES.index(key)] for key in camera_keys)
+
+    semantic_position = CAMERA_NAMES.index('semantic')
+    semantic_index = visual_indices[semantic_position] if semantic_position < len(visual_indices) else None
+
+    vector_size = sum(observation_shapes[i][0] for i in vector_indices)
+    stop = min(vector_size, STATE_STOP)
+    state_size = max(0, stop - STATE_START)
+    state_index, state_slice = None, slice(STATE_START, stop)
+    offset = 0
+    for i in vector_indices:
+        size = observation_shapes[i][0]
+        if offset <= STATE_START and stop <= offset + size:
+            state_index, state_slice = i, slice(STATE_START - offset, stop - offset)
+            break
+        offset += size
+    return ObservationLayout(visual_indices, visual_shape, camera_keys, camera_indices,
+                             vector_indices, vector_size, state_index, state_slice, state_size,
+                             semantic_index)
+
+
+_UINT8_SCALE = np.float32(255.0)
+_UINT16_SCALE = np.float32(65535.0)
+# Single channel depth formats, by the name passed as depth_format
+DEPTH_FORMATS = {'float16': np.float16, 'uint16': np.uint16}
+
+
+def preprocess_visual(single_visual_obs: np.ndarray, uint8_visual: bool) -> np.ndarray:
+    # Allocating conversion, used when observations are not written into buffers.
+    # The uint8 product is cast by the ufunc in small blocks, without a float copy of
+    # the image; the cast truncates like astype
+    if uint8_visual:
+        out = np.empty(single_visual_obs.shape, dtype=np.uint8)
+        np.multiply(single_visual_obs, _UINT8_SCALE, out=out, casting='unsafe')
+        return out
+    else:
+        return single_visual_obs
+
+
+def write_visual(single_visual_obs: np.ndarray, out: np.ndarray, scratch: np.ndarray = None) -> None:
+    # Write one camera into a preallocated array. For uint8 output the scaling goes
+    # through a preallocated float32 scratch array; a ufunc writing straight into
+    # uint8 would allocate its own casting buffers every call.
+    # The uint8 cast truncates, as astype does in preprocess_visual
+    if out.dtype == np.uint8:
+        if scratch is None:
+            scratch = np.empty(out.shape, dtype=np.float32)
+        np.multiply(single_visual_obs, _UINT8_SCALE, out=scratch)
+        np.copyto(out, scratch, casting='unsafe')
+    else:
+        np.copyto(out, single_visual_obs, casting='unsafe')
+
+
+def write_depth(single_visual_obs: np.ndarray, out: np.ndarray, scratch: np.ndarray = None) -> None:
+    # Write the first channel of a depth image, whose channels are all equal, into a
+    # [H, W, 1] float16 array or a uint16 array quantized to [0, 65535]
+    channel = single_visual_obs[..., :1]
+    if out.dtype == np.uint16:
+        if scratch is None:
+            scratch = np.empty(out.shape, dtype=np.float32)
+        np.multiply(channel, _UINT16_SCALE, out=scratch)
+        np.rint(scratch, out=scratch)
+        np.copyto(out, scratch, casting='unsafe')
+    else:
+        np.copyto(out, channel, casting='unsafe')
+
+
+class DepthBuffer(object):
+    """Convert depth images to one channel of DEPTH_FORMATS[depth_format].
+
+    With ring_size=K the images are written into a ring of K preallocated arrays,
+    like ObservationBuffer; with ring_size=0 every image is a new array.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], depth_format: str, ring_size: int = 0):
+        if depth_format not in DEPTH_FORMATS:
+            raise ValueError(f'Unknown depth_format {depth_format}, choose from {tuple(DEPTH_FORMATS)}')
+        self.depth_format = depth_format
+        self.dtype = np.dtype(DEPTH_FORMATS[depth_format])
+        self.shape = tuple(shape[:2]) + (1,)
+        self.ring_size = ring_size
+        self._buffers = np.zeros((max(ring_size, 1),) + self.shape, dtype=self.dtype)
+        self._scratch = np.empty(self.shape, dtype=np.float32) if self.dtype == np.uint16 else None
+        self._index = -1
+
+    def matches(self, shape: Tuple[int, ...], depth_format: str, ring_size: int) -> bool:
+        return (self.shape == tuple(shape[:2]) + (1,) and self.depth_format == depth_format
+                and self.ring_size == ring_size)
+
+    def write(self, single_visual_obs: np.ndarray) -> np.ndarray:
+        if self.ring_size:
+            self._index = (self._index + 1) % self.ring_size
+            out = self._buffers[self._index]
+        else:
+            out = np.empty(self.shape, dtype=self.dtype)
+        write_depth(single_visual_obs, out, self._scratch)
+        return out
+
+
+class ObservationBuffer(object):
+    """Ring of `ring_size` preallocated, contiguous [n_cameras, H, W, C] arrays.
+
+    Every write() fills the next slot of the ring and returns it, so an
+    observation stays valid until ring_size further observations were written.
+    """
+
+    def __init__(self, n_cameras: int, shape: Tuple[int, ...], uint8_visual: bool = False,
+                 ring_size: int = 1):
+        if ring_size < 1:
+            raise ValueError('ObservationBuffer needs a ring of at least one buffer')
+        self.dtype = np.dtype(np.uint8 if uint8_visual else np.float32)
+        self.shape = (n_cameras,) + tuple(shape)
+        self.ring_size = ring_size
+        self._buffers = np.zeros((ring_size,) + self.shape, dtype=self.dtype)
+        self._scratch = np.empty(self.shape[1:], dtype=np.float32) if uint8_visual else None
+        self._index = -1
+
+    def matches(self, n_cameras: int, shape: Tuple[int, ...], uint8_visual: bool, ring_size: int) -> bool:
+        dtype = np.dtype(np.uint8 if uint8_visual else np.float32)
+        return self.shape == (n_cameras,) + tuple(shape) and self.dtype == dtype and self.ring_size == ring_size
+
+    @property
+    def current(self) -> np.ndarray:
+        return self._buffers[max(self._index, 0)]
+
+    def write(self, obs: Sequence[np.ndarray], indices: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Convert the batched camera arrays obs[indices] (all of obs by default) of the
+        first agent into the next ring slot."""
+        self._index = (self._index + 1) % self.ring_size
+        out = self._buffers[self._index]
+        if indices is None:
+            indices = range(len(obs))
+        for i, index in enumerate(indices):
+            write_visual(obs[index][0], out[i], self._scratch)
+        return out
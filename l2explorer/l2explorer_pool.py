@@ -0,0 +1,267 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from .l2explorer_env import (L2ExplorerInstance, L2ExplorerTask,
+                             UnityGymException, needs_player)
+from .l2explorer_worker_ids import AUTO_WORKER_ID, allocate_worker_ids
+from .utils import get_l2explorer_app_location, get_l2explorer_worker_id
+
+"""
+Pool of Unity players launched ahead of time. Launching a player takes several
+seconds, so callers lease an already running instance for a block of episodes
+and return it to the pool afterwards instead of relaunching.
+"""
+
+# Launch attempts for a slot whose player died, and the seconds between them
+RELAUNCH_ATTEMPTS = 3
+RELAUNCH_BACKOFF = 1.0
+
+
+class L2ExplorerPool(object):
+    """Launch `size` Unity players in parallel and lease them out as L2ExplorerTasks.
+
+    Slot i always uses worker id base_worker_id + i; with base_worker_id='auto'
+    free ids are leased from the worker id registry until close(). A background thread checks
+    idle players every health_check_interval seconds and relaunches the ones whose
+    process has died; players returned dead by a lease are replaced as well. A slot
+    whose player can't be relaunched after RELAUNCH_ATTEMPTS is lost, see `lost`.
+    """
+
+    def __init__(self, size: int, base_worker_id: Optional[int] = None, debug: bool = False,
+                 editor_mode: bool = False, seed: Optional[int] = None,
+                 health_check_interval: float = 5.0, backend=None, cpu_affinity=None):
+        if size < 1:
+            raise ValueError('L2ExplorerPool needs at least one instance')
+        if editor_mode and size != 1:
+            raise ValueError('Only one instance can be connected to the Unity editor')
+        self._backend = backend
+        self._filename = None if editor_mode or not needs_player(backend) else get_l2explorer_app_location()
+        # One CpuAffinity per slot (see round_robin_layout); only the players are pinned,
+        # the leased tasks all run in this process
+        if cpu_affinity is not None and len(cpu_affinity) != size:
+            raise ValueError(f'Expected {size} CPU affinities, got {len(cpu_affinity)}')
+        self._cpu_affinity = cpu_affinity
+        if base_worker_id is None:
+            base_worker_id = get_l2explorer_worker_id()
+        self.size = size
+        self._worker_leases = allocate_worker_ids(size) if base_worker_id == AUTO_WORKER_ID else []
+        if self._worker_leases:
+            self.worker_ids = [lease.worker_id for lease in self._worker_leases]
+        else:
+            self.worker_ids = [base_worker_id + i for i in range(size)]
+        self.debug = debug
+        self._seed = L2ExplorerTask._DEFAULT_SEED if seed is None else int(seed)
+        self._health_check_interval = health_check_interval
+
+        self._lock = threading.Condition()
+        self._idle: List[L2ExplorerInstance] = []
+        self._leased: Dict[int, L2ExplorerInstance] = {}
+        # Worker id -> error of the slots that could not be relaunched
+        self._lost: Dict[int, BaseException] = {}
+        self._closed = False
+        self._launcher = ThreadPoolExecutor(max_workers=size, thread_name_prefix='l2explorer-launch')
+
+        # Launch all players at once, the startup time is spent waiting on Unity. If
+        # one fails, the others are closed and the worker ids released before raising
+        futures = [self._launcher.submit(self._launch, worker_id) for worker_id in self.worker_ids]
+        error = None
+        for future in futures:
+            try:
+                self._idle.append(future.result())
+            except BaseException as e:
+                error = error or e
+        if error is not None:
+            self._launcher.shutdown(wait=True)
+            for instance in self._idle:
+                instance.close()
+            self._idle = []
+            for lease in self._worker_leases:
+                lease.release()
+            raise error
+
+        self._stop = threading.Event()
+        self._health_thread = threading.Thread(target=self._health_loop, name='l2explorer-health', daemon=True)
+        self._health_thread.start()
+
+    def _launch(self, worker_id: int) -> L2ExplorerInstance:
+        # Each slot gets its own seed so instances don't replay identical episodes
+        seed = (self._seed + self.worker_ids.index(worker_id)) % L2ExplorerTask._MAX_INT
+        try:
+            instance = L2ExplorerInstance(self._filename, worker_id, seed, self.debug, self._backend)
+        except:
+            print(f'ERROR: could not launch pooled unity environment with worker id {worker_id}')
+            raise
+        if self._cpu_affinity is not None:
+            instance.pin(self._cpu_affinity[self.worker_ids.index(worker_id)])
+        return instance
+
+    def _lose(self, worker_id: int, error: BaseException) -> None:
+        # Record a slot that could not be relaunched, so lease() can report it
+        print(f'ERROR: pooled unity environment {worker_id} could not be relaunched, '
+              f'the pool has lost the slot: {error}')
+        with self._lock:
+            self._lost[worker_id] = error
+            self._lock.notify_all()
+
+    def _replace(self, instance: L2ExplorerInstance) -> None:
+        # Relaunch a dead player in the background and put it back in the idle list
+        def relaunch():
+            try:
+                instance.close()
+            except Exception:
+                pass
+            replacement, error = None, None
+            for attempt in range(1, RELAUNCH_ATTEMPTS + 1):
+                try:
+                    replacement = self._launch(instance.worker_id)
+                    break
+                except Exception as e:
+                    error = e
+                    print(f'WARNING: relaunch {attempt}/{RELAUNCH_ATTEMPTS} of pooled unity environment '
+                          f'{instance.worker_id} failed: {e}')
+                    # Wait before the next attempt, unless the pool is closing
+                    if attempt < RELAUNCH_ATTEMPTS and self._stop.wait(RELAUNCH_BACKOFF):
+                        return
+            if replacement is None:
+                self._lose(instance.worker_id, error)
+                return
+            with self._lock:
+                if self._closed:
+                    replacement.close()
+                    return
+                self._idle.append(replacement)
+                self._lock.notify()
+
+        with self._lock:
+            if not self._closed:
+                self._launcher.submit(relaunch)
+
+    def _health_loop(self) -> None:
+        while not self._stop.wait(self._health_check_interval):
+            with self._lock:
+                dead = [instance for instance in self._idle if not instance.is_alive()]
+                for instance in dead:
+                    self._idle.remove(instance)
+            for instance in dead:
+                print(f'WARNING: pooled unity environment {instance.worker_id} died, relaunching')
+                self._replace(instance)
+
+    @property
+    def available(self) -> int:
+        with self._lock:
+            return len(self._idle)
+
+    @property
+    def lost(self) -> Dict[int, BaseException]:
+        """Worker ids of the slots whose player could not be relaunched, with the error"""
+        with self._lock:
+            return dict(self._lost)
+
+    def _lost_message(self) -> str:
+        return ', '.join(f'{worker_id} ({error})' for worker_id, error in sorted(self._lost.items()))
+
+    def lease(self, timeout: Optional[float] = None, **task_kwargs) -> L2ExplorerTask:
+        """Take an idle player out of the pool and return a task bound to it.
+        task_kwargs are passed on to L2ExplorerTask (debug, uint8_visual, ...)."""
+        with self._lock:
+            if self._closed:
+                raise UnityGymException('L2ExplorerPool is closed')
+            if not self._lock.wait_for(lambda: self._idle or self._closed or len(self._lost) == self.size,
+                                       timeout):
+                lost = f', lost slots: {self._lost_message()}' if self._lost else ''
+                raise TimeoutError(f'No L2Explorer instance became available within {timeout} s{lost}')
+            if self._closed:
+                raise UnityGymException('L2ExplorerPool is closed')
+            if not self._idle:
+                raise UnityGymException(f'Every slot of the L2ExplorerPool was lost: {self._lost_message()}')
+            instance = self._idle.pop(0)
+            self._leased[id(instance)] = instance
+        task_kwargs.setdefault('debug', self.debug)
+        task_kwargs.setdefault('relaunch', self._relaunch_leased)
+        return L2ExplorerTask(instance=instance, **task_kwargs)
+
+    def _relaunch_leased(self, instance: L2ExplorerInstance) -> L2ExplorerInstance:
+        # Called by the watchdog of a leased task whose player hung: kill the player and
+        # launch a replacement in the same slot, which stays leased to the task
+        instance.kill()
+        try:
+            replacement = self._launch(instance.worker_id)
+        except Exception as e:
+            with self._lock:
+                self._leased.pop(id(instance), None)
+            self._lose(instance.worker_id, e)
+            raise
+        with self._lock:
+            if self._leased.pop(id(instance), None) is None or self._closed:
+                replacement.close()
+                raise UnityGymException('L2ExplorerPool is closed')
+            self._leased[id(replacement)] = replacement
+        return replacement
+
+    def release(self, task: L2ExplorerTask) -> None:
+        """Return the player leased by task to the pool. The task can't be used afterwards."""
+        instance = task.instance
+        task.close_env()
+        with self._lock:
+            if self._closed:
+                # close() already shut down every leased player
+                return
+            if instance is None or self._leased.pop(id(instance), None) is None:
+                raise ValueError('Task was not leased from this pool')
+            if instance.is_alive():
+                self._idle.append(instance)
+                self._lock.notify()
+                return
+        print(f'WARNING: unity environment {instance.worker_id} died during its lease, relaunching')
+        self._replace(instance)
+
+    @contextmanager
+    def leased(self, timeout: Optional[float] = None, **task_kwargs):
+        task = self.lease(timeout, **task_kwargs)
+        try:
+            yield task
+        finally:
+            self.release(task)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            instances = self._idle + list(self._leased.values())
+            self._idle = []
+            self._leased = {}
+            self._lock.notify_all()
+        self._stop.set()
+        self._health_thread.join()
+        self._launcher.shutdown(wait=True)
+        for instance in instances:
+            instance.close()
+        for lease in self._worker_leases:
+            lease.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
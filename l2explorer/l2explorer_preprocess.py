@@ -0,0 +1,189 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from .l2explorer_obs import CAMERA_NAMES
+
+"""
+Batched preprocessing of visual observations, e.g. the stacked
+[n_envs, n_cameras, H, W, C] observations of L2ExplorerVecEnv. Every stage runs
+as one vectorized operation over the whole batch, into arrays allocated once
+for the input shape. The area resize is done in NumPy rather than with
+cv2.resize, which takes one image per call: the whole batch is resized by one
+strided sum or two matrix products, with no per-frame Python loop or output
+allocation.
+"""
+
+CROP_MODES = ('center', 'ego')
+
+
+def area_weights(in_size: int, out_size: int) -> np.ndarray:
+    """[out_size, in_size] matrix averaging the input pixels each output pixel covers,
+    the weights of area interpolation along one axis"""
+    scale = in_size / out_size
+    weights = np.zeros((out_size, in_size), dtype=np.float64)
+    for o in range(out_size):
+        start, end = o * scale, (o + 1) * scale
+        for i in range(int(np.floor(start)), min(int(np.ceil(end)), in_size)):
+            weights[o, i] = min(end, i + 1) - max(start, i)
+    return (weights / weights.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def crop_window(height: int, width: int, mode: str, size: Tuple[int, int]) -> Tuple[slice, slice]:
+    """Rows and columns of a crop of size (h, w). 'center' crops the middle of the image,
+    'ego' the bottom center, the ground just ahead of the agent."""
+    crop_h, crop_w = size
+    if crop_h > height or crop_w > width:
+        raise ValueError(f'Crop {size} does not fit in an image of {(height, width)}')
+    left = (width - crop_w) // 2
+    top = (height - crop_h) // 2 if mode == 'center' else height - crop_h
+    return slice(top, top + crop_h), slice(left, left + crop_w)
+
+
+class BatchPreprocessor(object):
+    """Crop, area-resize, normalize and transpose batches of [..., H, W, C] images.
+
+    The stages run in that order, each is optional:
+        crop            ('center' or 'ego', (h, w))
+        resize          (h, w) output size with area interpolation; integer factors
+                        sum strided slices, others take two matrix products over
+                        the whole batch
+        normalize       convert to float32, uint8 input is scaled to [0, 1]; mean and
+                        std (per channel) are then applied if given
+        channels_first  return [..., C, H, W]
+    The output array is reused by the next call with the same key. keys
+    are the observation entries processed by process_observation().
+    """
+
+    def __init__(self, resize: Optional[Tuple[int, int]] = None, crop: Optional[Tuple[str, Tuple[int, int]]] = None,
+                 normalize: bool = False, mean: Optional[Sequence[float]] = None,
+                 std: Optional[Sequence[float]] = None, channels_first: bool = False,
+                 keys: Sequence[str] = ('visual',) + CAMERA_NAMES):
+        if crop is not None and crop[0] not in CROP_MODES:
+            raise ValueError(f'Unknown crop mode {crop[0]}, choose from {CROP_MODES}')
+        if (mean is not None or std is not None) and not normalize:
+            raise ValueError('mean and std need normalize=True')
+        self.resize = None if resize is None else tuple(resize)
+        self.crop = crop
+        self.normalize = normalize
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float32)
+        self.std = None if std is None else np.asarray(std, dtype=np.float32)
+        self.channels_first = channels_first
+        self.keys = tuple(keys)
+        self._plans = {}
+
+    def _plan(self, shape: Tuple[int, ...], dtype: np.dtype) -> '_Plan':
+        # Allocate the intermediate and output arrays for inputs of this shape
+        plan = _Plan()
+        *lead, height, width, channels = shape
+        plan.batch = int(np.prod(lead)) if lead else 1
+        plan.rows, plan.cols = slice(0, height), slice(0, width)
+        if self.crop is not None:
+            plan.rows, plan.cols = crop_window(height, width, self.crop[0], self.crop[1])
+            height, width = plan.rows.stop - plan.rows.start, plan.cols.stop - plan.cols.start
+        scale = np.float32(1.0 / 255.0) if self.normalize and dtype == np.uint8 else np.float32(1.0)
+        float_output = self.normalize or self.resize is not None
+        out_dtype = np.float32 if float_output else dtype
+
+        plan.factors = None
+        if self.resize is not None:
+            out_h, out_w = self.resize
+            plan.rows_done = np.empty((plan.batch, out_h, width * channels), dtype=np.float32)
+            if height % out_h == 0 and width % out_w == 0:
+                # Integer downsampling sums strided slices, cheaper than the matrix products
+                plan.factors = (height // out_h, width // out_w)
+                scale = scale / np.float32(plan.factors[0] * plan.factors[1])
+            else:
+                # The uint8 scaling is folded into the row weights
+                plan.row_weights = area_weights(height, out_h) * scale
+                # Columns interleave with channels in [.., w*C] rows, so the column pass is one
+                # matrix product with the [w*C, out_w*C] Kronecker expansion of the weights
+                plan.col_weights = np.kron(area_weights(width, out_w).T, np.eye(channels, dtype=np.float32))
+                plan.input = np.empty((plan.batch, height, width * channels), dtype=np.float32)
+                scale = np.float32(1.0)
+            height, width = out_h, out_w
+        plan.scale = scale
+        plan.work = np.empty((plan.batch, height, width, channels), dtype=out_dtype)
+        if self.channels_first:
+            plan.out = np.empty(tuple(lead) + (channels, height, width), dtype=out_dtype)
+        else:
+            plan.out = plan.work.reshape(tuple(lead) + (height, width, channels))
+        return plan
+
+    def __call__(self, images: np.ndarray, key: Optional[str] = None) -> np.ndarray:
+        """Process a batch of images. Each key has its own output arrays, so the
+        results for different keys don't overwrite each other."""
+        images = np.asarray(images)
+        plan = self._plans.get(key)
+        if plan is None or plan.key != (images.shape, images.dtype):
+            plan = self._plans[key] = self._plan(images.shape, images.dtype)
+            plan.key = (images.shape, images.dtype)
+        height, width, channels = images.shape[-3:]
+        batch = images.reshape((plan.batch, height, width, channels))[:, plan.rows, plan.cols]
+
+        if plan.factors is not None:
+            self._downsample(plan, batch)
+        elif self.resize is not None:
+            self._resize(plan, batch)
+        else:
+            np.copyto(plan.work, batch, casting='unsafe')
+        if plan.scale != 1.0:
+            np.multiply(plan.work, plan.scale, out=plan.work)
+
+        if self.mean is not None:
+            np.subtract(plan.work, self.mean, out=plan.work)
+        if self.std is not None:
+            np.divide(plan.work, self.std, out=plan.work)
+        if self.channels_first:
+            np.copyto(plan.out.reshape((plan.batch,) + plan.out.shape[-3:]), plan.work.transpose(0, 3, 1, 2))
+        return plan.out
+
+    def _downsample(self, plan: '_Plan', batch: np.ndarray) -> None:
+        # Sum the factor_h rows and then the factor_w columns of every output pixel
+        factor_h, factor_w = plan.factors
+        n, height, width, channels = batch.shape
+        out_h, out_w = self.resize
+        rows = batch.reshape(n, out_h, factor_h, width * channels)
+        np.copyto(plan.rows_done, rows[:, :, 0], casting='unsafe')
+        for i in range(1, factor_h):
+            np.add(plan.rows_done, rows[:, :, i], out=plan.rows_done, dtype=np.float32)
+        cols = plan.rows_done.reshape(n, out_h, out_w, factor_w, channels)
+        np.copyto(plan.work, cols[:, :, :, 0])
+        for i in range(1, factor_w):
+            np.add(plan.work, cols[:, :, :, i], out=plan.work)
+
+    def _resize(self, plan: '_Plan', batch: np.ndarray) -> None:
+        # [out_h, h] @ [B, h, w*C] resizes the rows, [B*out_h, w*C] @ [w*C, out_w*C] the columns
+        n, height, width, channels = batch.shape
+        out_h, out_w = self.resize
+        np.copyto(plan.input.reshape(batch.shape), batch, casting='unsafe')
+        np.matmul(plan.row_weights, plan.input, out=plan.rows_done)
+        np.matmul(plan.rows_done.reshape(n * out_h, width * channels), plan.col_weights,
+                  out=plan.work.reshape(n * out_h, out_w * channels))
+
+    def process_observation(self, observation: dict) -> dict:
+        """Apply the pipeline to the image entries (keys) of an observation dict"""
+        return {key: self(value, key) if key in self.keys else value for key, value in observation.items()}
+
+
+class _Plan(object):
+    # Arrays and slices BatchPreprocessor allocated for one input shape
+    pass
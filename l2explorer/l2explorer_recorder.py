@@ -0,0 +1,277 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+import os
+import queue
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+"""
+Streaming trajectory recorder. Steps are copied into preallocated chunks of
+chunk_size rows which a background thread writes to disk, so memory stays
+bounded on long runs and the step loop does not wait for the disk.
+
+A recording directory holds
+    meta.json       array names, shapes and dtypes, chunk size and format
+    index.jsonl     one line per episode segment of a written chunk:
+                    {"episode", "step", "chunk", "offset", "length"}
+    chunk_NNNNNN.npz (compressed) or chunk_NNNNNN/<array>.npy (uncompressed,
+                    can be memory mapped, see l2explorer_dataset.py)
+
+Row i of a recording holds an observation (one array per camera plus the
+state), the reward and done flag received with it, and the action taken from
+it. The last row of an episode has a zero action.
+"""
+
+META_FILE = 'meta.json'
+INDEX_FILE = 'index.jsonl'
+# Per-row arrays stored next to the observation arrays
+ROW_FIELDS = ('action', 'reward', 'done', 'episode', 'step')
+
+
+def flatten_observation(observation: Dict[str, Any], camera_keys) -> Dict[str, np.ndarray]:
+    """One array per camera and per other observation entry. The 'visual' entry of
+    the default observation is split into its cameras."""
+    flat = {}
+    for key, value in observation.items():
+        if key == 'visual':
+            for camera_key, camera in zip(camera_keys, value):
+                flat[camera_key] = camera
+        else:
+            flat[key] = value
+    return flat
+
+
+class _Chunk(object):
+    # Preallocated arrays for chunk_size rows
+    def __init__(self, specs: Dict[str, tuple], chunk_size: int):
+        self.arrays = {name: np.zeros((chunk_size,) + shape, dtype=dtype)
+                       for name, (shape, dtype) in specs.items()}
+        self.index = 0
+        self.rows = 0
+        self.segments: List[Dict[str, int]] = []
+
+    def clear(self, index: int) -> None:
+        self.index = index
+        self.rows = 0
+        self.segments = []
+
+
+class L2ExplorerRecorder(object):
+    """Wrap an L2ExplorerTask and record every observation, action, reward and done
+    flag to `directory`.
+
+    reset() and step() behave as those of the task. Up to max_pending full chunks
+    wait for the writer thread; if the disk can't keep up, step() waits for a chunk
+    to be written rather than growing memory. Call close() to write the last chunk.
+    """
+
+    def __init__(self, task, directory: str, chunk_size: int = 1000, compress: bool = True,
+                 max_pending: int = 4):
+        if chunk_size < 1:
+            raise ValueError('chunk_size must be at least 1')
+        self.task = task
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.compress = compress
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(os.path.join(directory, INDEX_FILE)):
+            raise ValueError(f'{directory} already holds a recording')
+
+        self._specs: Optional[Dict[str, tuple]] = None
+        self._chunk: Optional[_Chunk] = None
+        self._n_chunks = 0
+        self._episode = -1
+        self._step = 0
+        self._pending = False  # whether the current row holds an observation waiting for its action
+        self._closed = False
+
+        # Full chunks go to the writer, written chunks come back to be refilled
+        self._free: 'queue.Queue[_Chunk]' = queue.Queue()
+        self._max_chunks = max_pending + 1
+        self._allocated = 0
+        self._full: 'queue.Queue[Optional[_Chunk]]' = queue.Queue()
+        self._error: Optional[BaseException] = None
+        self._writer = threading.Thread(target=self._write_loop, name='l2explorer-recorder', daemon=True)
+        self._writer.start()
+
+    def __getattr__(self, name):
+        # Everything else (observation_space, seed, close_env, ...) comes from the task
+        return getattr(self.task, name)
+
+    def reset(self, params):
+        observation = self.task.reset(params)
+        if self._pending:
+            # The previous episode was abandoned before it ended
+            self._commit(None)
+        self._episode += 1
+        self._step = 0
+        self._hold(observation, 0.0, False)
+        return observation
+
+    def step(self, action):
+        result = self.task.step(action)
+        observation, reward, done, _ = result
+        if not self._pending:
+            return result
+        self._commit(action)
+        if not observation:
+            # step() after the end of the episode returns an empty observation
+            return result
+        self._hold(observation, reward, done)
+        if done:
+            self._commit(None)
+        return result
+
+    def _hold(self, observation, reward, done) -> None:
+        # Copy the observation into the next row of the current chunk right away: the
+        # task reuses its observation buffers, so the next step() would overwrite it
+        if self._error is not None:
+            raise self._error
+        layout = self.task.observation_layout
+        flat = flatten_observation(observation, layout.camera_keys)
+        if self._specs is None:
+            self._specs = {name: (np.shape(value), np.asarray(value).dtype)
+                           for name, value in flat.items()}
+            action_size = self.task.action_space.shape[0]
+            self._specs.update(action=((action_size,), np.float32), reward=((), np.float32),
+                               done=((), np.bool_), episode=((), np.int64), step=((), np.int64))
+            self._write_meta()
+        if self._chunk is None:
+            self._chunk = self._take_chunk()
+        row = self._chunk.rows
+        arrays = self._chunk.arrays
+        for name, value in flat.items():
+            arrays[name][row] = value
+        arrays['reward'][row] = reward
+        arrays['done'][row] = done
+        arrays['episode'][row] = self._episode
+        arrays['step'][row] = self._step
+        self._pending = True
+
+    def _commit(self, action) -> None:
+        # Add the action taken from the held observation and close its row
+        chunk, row = self._chunk, self._chunk.rows
+        chunk.arrays['action'][row] = 0.0 if action is None else np.asarray(action).reshape(-1)
+        if chunk.segments and chunk.segments[-1]['episode'] == self._episode:
+            chunk.segments[-1]['length'] += 1
+        else:
+            chunk.segments.append({'episode': self._episode, 'step': self._step, 'offset': row, 'length': 1})
+        chunk.rows += 1
+        self._step += 1
+        self._pending = False
+        if chunk.rows == self.chunk_size:
+            self._hand_off()
+
+    def _take_chunk(self) -> _Chunk:
+        try:
+            chunk = self._free.get_nowait()
+        except queue.Empty:
+            if self._allocated < self._max_chunks:
+                self._allocated += 1
+                chunk = _Chunk(self._specs, self.chunk_size)
+            else:
+                # The writer is behind, wait for it to return a chunk
+                chunk = self._free.get()
+        chunk.clear(self._n_chunks)
+        self._n_chunks += 1
+        return chunk
+
+    def _hand_off(self) -> None:
+        self._full.put(self._chunk)
+        self._chunk = None
+
+    def _write_meta(self) -> None:
+        meta = {'chunk_size': self.chunk_size, 'compress': self.compress,
+                'arrays': {name: {'shape': list(shape), 'dtype': np.dtype(dtype).str}
+                           for name, (shape, dtype) in self._specs.items()}}
+        with open(os.path.join(self.directory, META_FILE), 'w') as meta_file:
+            json.dump(meta, meta_file, indent=2)
+
+    def _write_loop(self) -> None:
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        with open(index_path, 'a') as index_file:
+            while True:
+                chunk = self._full.get()
+                if chunk is None:
+                    self._full.task_done()
+                    return
+                try:
+                    name = self._write_chunk(chunk)
+                    # Index the chunk only once it is completely on disk
+                    for segment in chunk.segments:
+                        index_file.write(json.dumps(dict(segment, chunk=name)) + '\n')
+                    index_file.flush()
+                except BaseException as e:
+                    print(f'ERROR: could not write recording chunk {chunk.index}: {e}')
+                    self._error = e
+                self._free.put(chunk)
+                self._full.task_done()
+
+    def _write_chunk(self, chunk: _Chunk) -> str:
+        name = f'chunk_{chunk.index:06d}'
+        arrays = {key: value[:chunk.rows] for key, value in chunk.arrays.items()}
+        if self.compress:
+            tmp_path = os.path.join(self.directory, name + '.tmp.npz')
+            np.savez_compressed(tmp_path, **arrays)
+            os.replace(tmp_path, os.path.join(self.directory, name + '.npz'))
+            return name + '.npz'
+        tmp_dir = os.path.join(self.directory, name + '.tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        for key, value in arrays.items():
+            np.save(os.path.join(tmp_dir, key + '.npy'), value)
+        os.replace(tmp_dir, os.path.join(self.directory, name))
+        return name
+
+    def flush(self) -> None:
+        """Hand the partly filled chunk to the writer and wait until everything is written"""
+        if self._chunk is not None and self._chunk.rows:
+            # The row of a held observation is not committed yet, it moves to a fresh chunk
+            row = self._chunk.rows
+            held = {name: array[row].copy() for name, array in self._chunk.arrays.items()} if self._pending else None
+            self._hand_off()
+            if held is not None:
+                self._chunk = self._take_chunk()
+                for name, value in held.items():
+                    self._chunk.arrays[name][0] = value
+        self._full.join()
+        if self._error is not None:
+            raise self._error
+
+    def close(self) -> None:
+        """Write the remaining rows and stop the writer. The task is not closed."""
+        if self._closed:
+            return
+        if self._pending:
+            self._commit(None)
+        if self._chunk is not None and self._chunk.rows:
+            self._hand_off()
+        self._full.put(None)
+        self._writer.join()
+        self._closed = True
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,109 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+"""
+Decoding of the semantic segmentation camera into layer labels. Unity recolors
+every object by its layer (see docs/Outline.md), so each pixel is one of a fixed
+palette of colors whose channels are 0, 0.69 or 1.
+"""
+
+# Segmentation colors by object layer, the label of a layer is its position here
+LAYER_COLORS = {
+    'skybox': (0.0, 0.0, 0.0),
+    'default': (1.0, 1.0, 1.0),
+    'building': (0.69, 1.0, 0.69),
+    'target': (0.0, 1.0, 1.0),
+    'neutral': (1.0, 0.69, 0.69),
+    'hazard': (1.0, 0.0, 1.0),
+}
+LAYER_NAMES = tuple(LAYER_COLORS)
+# Label of pixels whose color is not in the palette (e.g. blended at edges)
+UNKNOWN_LABEL = len(LAYER_NAMES)
+N_LABELS = UNKNOWN_LABEL + 1
+
+# A channel is quantized to 0, 1 or 2 by rounding 2 * value (0.69 -> 1.38 -> 1), and
+# the three channel levels form a base-3 color code
+_CODE_WEIGHTS = np.array([9.0, 3.0, 1.0], dtype=np.float32)
+
+
+def object_layer(obj: dict) -> str:
+    """Layer of an object of the reset json, which decides its segmentation color"""
+    if str(obj.get('class', '')).lower() == 'building':
+        return 'building'
+    reward = float(obj.get('reward', 0.0))
+    if reward > 0:
+        return 'target'
+    if reward < 0:
+        return 'hazard'
+    return 'neutral'
+
+
+def build_label_lut() -> np.ndarray:
+    """Label of each of the 27 color codes"""
+    lut = np.full(27, UNKNOWN_LABEL, dtype=np.uint8)
+    for label, color in enumerate(LAYER_COLORS.values()):
+        levels = np.rint(2 * np.array(color, dtype=np.float32))
+        lut[int(levels @ _CODE_WEIGHTS)] = label
+    return lut
+
+
+class SemanticDecoder(object):
+    """Convert [H, W, 3] segmentation images in [0, 1] into [H, W] uint8 label maps.
+
+    The scratch arrays are allocated once for the image shape. With ring_size=K the
+    label maps are written into a ring of K preallocated arrays, like ObservationBuffer;
+    with ring_size=0 every label map is a new array.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], ring_size: int = 0):
+        self.shape = tuple(shape)
+        height, width = self.shape[:2]
+        self.lut = build_label_lut()
+        self.ring_size = ring_size
+        self._levels = np.empty(self.shape, dtype=np.float32)
+        self._codes = np.empty((height, width), dtype=np.float32)
+        self._indices = np.empty((height, width), dtype=np.intp)
+        self._labels = np.empty((max(ring_size, 1), height, width), dtype=np.uint8)
+        self._index = -1
+
+    def matches(self, shape: Tuple[int, ...], ring_size: int) -> bool:
+        return self.shape == tuple(shape) and self.ring_size == ring_size
+
+    def decode(self, image: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        if out is None:
+            if self.ring_size:
+                self._index = (self._index + 1) % self.ring_size
+                out = self._labels[self._index]
+            else:
+                out = np.empty(self._codes.shape, dtype=np.uint8)
+        np.multiply(image, np.float32(2.0), out=self._levels)
+        np.rint(self._levels, out=self._levels)
+        np.clip(self._levels, 0.0, 2.0, out=self._levels)
+        np.dot(self._levels, _CODE_WEIGHTS, out=self._codes)
+        np.copyto(self._indices, self._codes, casting='unsafe')
+        np.take(self.lut, self._indices, out=out)
+        return out
+
+    @staticmethod
+    def histogram(labels: np.ndarray) -> np.ndarray:
+        """Number of pixels of each label, indexed like LAYER_NAMES plus UNKNOWN_LABEL"""
+        return np.bincount(labels.reshape(-1), minlength=N_LABELS)
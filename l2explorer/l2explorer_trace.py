@@ -0,0 +1,146 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .l2explorer_metrics import shadow, unshadow
+
+"""
+Timeline tracing in the Chrome trace event format, viewable in chrome://tracing
+or https://ui.perfetto.dev. Spans are buffered and streamed to the file in
+chunks, so long runs don't keep the trace in memory. One tracer can be shared
+by every task of a process; each worker id gets its own track.
+"""
+
+
+class ChromeTracer(object):
+    """Write complete ('X') trace events to path, flushing every flush_every events.
+
+    Tasks created with tracer=... record their reset, step, UnityEnvironment.step,
+    observation conversion and side channel spans; agent code can add its own with
+    span(). Call close() to terminate the JSON array.
+    """
+
+    def __init__(self, path: str, flush_every: int = 1000):
+        self.path = path
+        self.flush_every = flush_every
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._events: List[Dict[str, Any]] = []
+        self._tracks = set()
+        # (weak reference to obj, method name) of the wrappers installed. A tracer shared
+        # by many tasks must not keep closed ones alive; what each wrapper replaced is
+        # kept on the wrapper, which lives on obj
+        self._instrumented: List[Tuple[weakref.ref, str]] = []
+        self._file = open(path, 'w')
+        self._file.write('[')
+        self._first = True
+
+    def add_track(self, tid: int, name: str) -> None:
+        """Name the track tid (e.g. a worker id) in the viewer"""
+        with self._lock:
+            if tid in self._tracks:
+                return
+            self._tracks.add(tid)
+            self._events.append({'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': tid,
+                                 'args': {'name': name}})
+
+    def add_span(self, name: str, category: str, start: float, end: float, tid: int,
+                 args: Optional[Dict[str, Any]] = None) -> None:
+        """Record a span between two time.perf_counter() values"""
+        event = {'name': name, 'cat': category, 'ph': 'X', 'ts': start * 1e6, 'dur': (end - start) * 1e6,
+                 'pid': self._pid, 'tid': tid}
+        if args:
+            event['args'] = args
+        with self._lock:
+            if self._file is None:
+                return
+            self._events.append(event)
+            if len(self._events) >= self.flush_every:
+                self._write_events()
+
+    @contextmanager
+    def span(self, name: str, tid: int = 0, category: str = 'agent', **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, category, start, time.perf_counter(), tid, args)
+
+    def instrument(self, obj: Any, method_name: str, span_name: str, category: str, tid: int,
+                   args_fn: Optional[Callable[[], Dict[str, Any]]] = None) -> None:
+        """Record a span for every call of obj.method_name. args_fn is called when the
+        call starts and returns the args of the span (episode, step, ...)."""
+        method = getattr(obj, method_name)
+        add_span = self.add_span
+
+        def traced(*call_args, **call_kwargs):
+            args = args_fn() if args_fn is not None else None
+            start = time.perf_counter()
+            try:
+                return method(*call_args, **call_kwargs)
+            finally:
+                add_span(span_name, category, start, time.perf_counter(), tid, args)
+        with self._lock:
+            traced.previous = shadow(obj, method_name, traced)
+            # Drop the entries of objects that were collected meanwhile
+            self._instrumented = [entry for entry in self._instrumented if entry[0]() is not None]
+            self._instrumented.append((weakref.ref(obj), method_name))
+
+    def restore(self, obj: Any) -> None:
+        """Remove the tracing wrappers installed on obj"""
+        with self._lock:
+            entries = [entry for entry in self._instrumented if entry[0]() is obj]
+            for entry in reversed(entries):
+                unshadow(obj, entry[1], vars(obj)[entry[1]].previous)
+                self._instrumented.remove(entry)
+
+    def _write_events(self) -> None:
+        # Called with the lock held
+        if self._file is None or not self._events:
+            return
+        chunk = ',\n'.join(json.dumps(event) for event in self._events)
+        self._file.write(('\n' if self._first else ',\n') + chunk)
+        self._file.flush()
+        self._first = False
+        self._events = []
+
+    def flush(self) -> None:
+        with self._lock:
+            self._write_events()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is None:
+                return
+            self._write_events()
+            self._file.write('\n]\n')
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,316 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import copy
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .l2explorer_preprocess import BatchPreprocessor
+from .l2explorer_worker_ids import AUTO_WORKER_ID, allocate_worker_ids
+from .utils import get_l2explorer_worker_id
+
+"""
+Vectorized L2Explorer environment. Each worker runs its own L2ExplorerTask
+(and therefore its own Unity instance) in a subprocess, and the parent
+exchanges batched resets and steps with all of them.
+"""
+
+# Offsets of the arrays in the shared memory block are aligned to cache lines
+_ALIGNMENT = 64
+
+
+def observation_spec(obs: Dict) -> Tuple:
+    """(key, shape, dtype) of every entry of a worker observation. A list of
+    cameras is described as the [n_cameras, H, W, C] array it stacks into."""
+    spec = []
+    for key, value in obs.items():
+        if isinstance(value, (list, tuple)):
+            first = np.asarray(value[0])
+            spec.append((key, (len(value),) + first.shape, first.dtype.str))
+        else:
+            value = np.asarray(value)
+            spec.append((key, value.shape, value.dtype.str))
+    return tuple(spec)
+
+
+class SharedObservations(object):
+    """The observations of all workers in one multiprocessing.shared_memory block.
+
+    Entry `key` of spec is an [num_envs, *shape] array in the block, worker i
+    writes its observation into row i of each. The parent creates the block
+    (name=None) and the workers attach to it by name.
+    """
+
+    def __init__(self, num_envs: int, spec: Tuple, name: Optional[str] = None):
+        self.num_envs = num_envs
+        self.spec = spec
+        offsets, size = [], 0
+        for _, shape, dtype in spec:
+            offsets.append(size)
+            nbytes = num_envs * int(np.prod(shape)) * np.dtype(dtype).itemsize
+            size += -(-nbytes // _ALIGNMENT) * _ALIGNMENT
+        if name is None:
+            self._shm = SharedMemory(create=True, size=max(size, 1))
+        else:
+            self._shm = SharedMemory(name=name)
+        self.name = self._shm.name
+        self.arrays = {key: np.ndarray((num_envs,) + tuple(shape), dtype=dtype, buffer=self._shm.buf, offset=offset)
+                       for (key, shape, dtype), offset in zip(spec, offsets)}
+
+    def write(self, index: int, obs: Dict) -> None:
+        for key, value in obs.items():
+            if isinstance(value, (list, tuple)):
+                for camera, image in enumerate(value):
+                    self.arrays[key][index, camera] = image
+            else:
+                self.arrays[key][index] = value
+
+    def read(self, index: int) -> Dict[str, np.ndarray]:
+        # A copy of the observation of one worker
+        return {key: array[index].copy() for key, array in self.arrays.items()}
+
+    def close(self, unlink: bool = False) -> None:
+        # The views must be gone before the mapping can be closed
+        self.arrays = {}
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+def _worker(remote, parent_remote, task_kwargs: Dict[str, Any], index: int = 0) -> None:
+    # Imported here so the parent process does not need to touch mlagents
+    from .l2explorer_env import L2ExplorerRestartedError, L2ExplorerTask
+
+    parent_remote.close()
+    task = L2ExplorerTask(**task_kwargs)
+    params = None
+    shared = None
+
+    def pack(obs):
+        # With shared memory only observations that don't fit its layout are pickled
+        if shared is not None and observation_spec(obs) == shared.spec:
+            shared.write(index, obs)
+            return None
+        return obs
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                try:
+                    obs, reward, done, info = task.step(data)
+                except L2ExplorerRestartedError as e:
+                    # The watchdog relaunched a hung player, only this episode is lost
+                    remote.send((pack(e.observation), 0.0, True, {'worker_restarted': True}))
+                    continue
+                # The raw mlagents step result duplicates the observation, don't pickle it
+                info.pop('step', None)
+                if done:
+                    # Auto-reset, the last observation of the episode is kept in info. It is
+                    # copied, the reset may write its observation into the same ring slots
+                    info['terminal_observation'] = copy.deepcopy(obs)
+                    obs = task.reset(params)
+                remote.send((pack(obs), reward, done, info))
+            elif cmd == 'reset':
+                params = data
+                remote.send(pack(task.reset(params)))
+            elif cmd == 'attach':
+                if shared is not None:
+                    shared.close()
+                shared = SharedObservations(*data)
+                remote.send(None)
+            elif cmd == 'seed':
+                task.seed(data)
+                remote.send(None)
+            elif cmd == 'close':
+                break
+            else:
+                raise NotImplementedError(f'Unknown command for L2Explorer worker: {cmd}')
+    except KeyboardInterrupt:
+        print('INFO: L2Explorer worker got KeyboardInterrupt')
+    finally:
+        if shared is not None:
+            shared.close()
+        task.close_env()
+        remote.close()
+
+
+def stack_observations(obs_list: Sequence[Dict]) -> Dict[str, np.ndarray]:
+    """Stack a list of per-worker observation dicts into a dict of batched arrays.
+
+    The visual list of each worker becomes one [n_cameras, H, W, C] array, so the
+    stacked visual observation has shape [n_envs, n_cameras, H, W, C].
+    """
+    return {key: np.stack([np.asarray(obs[key]) for obs in obs_list]) for key in obs_list[0]}
+
+
+class L2ExplorerVecEnv(object):
+    """Drive several independent L2Explorer instances with batched reset and step.
+
+    Worker i runs L2ExplorerTask with worker id base_worker_id + i in its own
+    subprocess; with base_worker_id='auto' the parent leases free ids from the
+    worker id registry until close(). Episodes that end during step() are reset automatically with the
+    parameters of the last reset(); the final observation of the finished
+    episode is returned in info['terminal_observation'].
+
+    preprocess, e.g. a BatchPreprocessor, is applied once to the stacked
+    observations of every reset and step. Its outputs are reused, so they are
+    only valid until the next step; terminal observations are not preprocessed.
+
+    With shared_memory=True the workers write their observations into a
+    shared memory block laid out after the first reset, and only rewards, dones
+    and infos are pickled through the pipes. The returned observations are then
+    views of that block, overwritten by the next step.
+
+    With the step_timeout option of the tasks, a worker whose Unity player hangs
+    relaunches it and returns done with info['worker_restarted'] and the first
+    observation of the replayed episode, instead of stalling every worker.
+    """
+
+    def __init__(self, num_envs: int, base_worker_id: Optional[int] = None,
+                 start_method: str = 'spawn', preprocess: Optional[BatchPreprocessor] = None,
+                 shared_memory: bool = False, cpu_affinity: Optional[Sequence] = None, **task_kwargs):
+        if num_envs < 1:
+            raise ValueError('L2ExplorerVecEnv needs at least one environment')
+        if base_worker_id is None:
+            base_worker_id = get_l2explorer_worker_id()
+        self.num_envs = num_envs
+        self._worker_leases = allocate_worker_ids(num_envs) if base_worker_id == AUTO_WORKER_ID else []
+        if self._worker_leases:
+            self.worker_ids = [lease.worker_id for lease in self._worker_leases]
+        else:
+            self.worker_ids = [base_worker_id + i for i in range(num_envs)]
+        self.preprocess = preprocess
+        self.shared_memory = shared_memory
+        self._shared: Optional[SharedObservations] = None
+        self._waiting = False
+        self._closed = False
+
+        # One CpuAffinity per worker (see round_robin_layout), pinning its player and process
+        if cpu_affinity is not None and len(cpu_affinity) != num_envs:
+            raise ValueError(f'Expected {num_envs} CPU affinities, got {len(cpu_affinity)}')
+
+        ctx = mp.get_context(start_method)
+        self._remotes, self._work_remotes = zip(*[ctx.Pipe() for _ in range(num_envs)])
+        self._processes = []
+        for index, (work_remote, remote, worker_id) in enumerate(zip(self._work_remotes, self._remotes,
+                                                                     self.worker_ids)):
+            kwargs = dict(task_kwargs, worker_id=worker_id)
+            if cpu_affinity is not None:
+                kwargs['cpu_affinity'] = cpu_affinity[index]
+            process = ctx.Process(target=_worker, args=(work_remote, remote, kwargs, index), daemon=True)
+            process.start()
+            self._processes.append(process)
+            work_remote.close()
+
+    def _stack(self, obs_list: Sequence[Optional[Dict]]) -> Dict[str, np.ndarray]:
+        # None entries were written into the shared memory block by their worker
+        if all(obs is None for obs in obs_list):
+            obs = dict(self._shared.arrays)
+        else:
+            if self._shared is not None:
+                obs_list = [self._shared.read(i) if obs is None else obs for i, obs in enumerate(obs_list)]
+            obs = stack_observations(obs_list)
+            if self.shared_memory:
+                obs = self._allocate_shared(obs)
+        if self.preprocess is not None:
+            obs = self.preprocess.process_observation(obs)
+        return obs
+
+    def _allocate_shared(self, obs: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        # (Re)build the shared memory block for observations like obs and attach the workers
+        spec = tuple((key, value.shape[1:], value.dtype.str) for key, value in obs.items())
+        shared = SharedObservations(self.num_envs, spec)
+        for remote in self._remotes:
+            remote.send(('attach', (self.num_envs, spec, shared.name)))
+        for remote in self._remotes:
+            remote.recv()
+        if self._shared is not None:
+            self._shared.close(unlink=True)
+        self._shared = shared
+        for key, value in obs.items():
+            shared.arrays[key][...] = value
+        return dict(shared.arrays)
+
+    def seed(self, val: int) -> None:
+        # Each worker gets its own seed so instances don't replay identical episodes
+        for i, remote in enumerate(self._remotes):
+            remote.send(('seed', val + i))
+        for remote in self._remotes:
+            remote.recv()
+
+    def reset(self, params_list) -> Dict[str, np.ndarray]:
+        """Reset all workers. params_list holds one L2Explorer json dict per worker,
+        or a single dict that is used for every worker."""
+        if isinstance(params_list, dict):
+            params_list = [params_list] * self.num_envs
+        if len(params_list) != self.num_envs:
+            raise ValueError(f'Expected {self.num_envs} reset params, got {len(params_list)}')
+        for remote, params in zip(self._remotes, params_list):
+            remote.send(('reset', params))
+        return self._stack([remote.recv() for remote in self._remotes])
+
+    def step_async(self, actions) -> None:
+        actions = np.asarray(actions)
+        if actions.shape[0] != self.num_envs:
+            raise ValueError(f'Expected actions for {self.num_envs} environments, got {actions.shape[0]}')
+        for remote, action in zip(self._remotes, actions):
+            remote.send(('step', action))
+        self._waiting = True
+
+    def step_wait(self):
+        results = [remote.recv() for remote in self._remotes]
+        self._waiting = False
+        obs, rewards, dones, infos = zip(*results)
+        return (self._stack(obs), np.array(rewards, dtype=np.float32),
+                np.array(dones, dtype=bool), list(infos))
+
+    def step(self, actions):
+        """Step every worker with actions of shape [num_envs, 3].
+        Returns stacked observations, rewards, dones and a list of infos."""
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        if self._waiting:
+            for remote in self._remotes:
+                remote.recv()
+        for remote in self._remotes:
+            remote.send(('close', None))
+        for process in self._processes:
+            process.join()
+        if self._shared is not None:
+            self._shared.close(unlink=True)
+            self._shared = None
+        for lease in self._worker_leases:
+            lease.release()
+        self._closed = True
+
+    def __len__(self) -> int:
+        return self.num_envs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
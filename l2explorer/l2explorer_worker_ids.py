@@ -0,0 +1,133 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import socket
+import tempfile
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, worker ids are then only checked by probing their ports
+    fcntl = None
+
+"""
+Allocation of free worker ids, and therefore free Unity ports, for processes
+sharing a node. Each id is leased by holding an exclusive flock on its file
+in a registry directory under /tmp. The kernel drops the lock when the holder
+exits, so ids of crashed processes are reclaimed without any cleanup. Ids whose
+port is taken by a process outside the registry are skipped.
+"""
+
+# mlagents' UnityEnvironment.BASE_ENVIRONMENT_PORT, worker id i talks on port BASE_PORT + i
+BASE_PORT = 5005
+MAX_WORKER_ID = 1000
+# Value of L2EXPLORER_WORKER_ID or worker_id selecting an allocated id
+AUTO_WORKER_ID = 'auto'
+
+
+def registry_directory() -> str:
+    return os.environ.get('L2EXPLORER_WORKER_ID_DIR',
+                          os.path.join(tempfile.gettempdir(), 'l2explorer_worker_ids'))
+
+
+def port_is_free(port: int) -> bool:
+    # The same check mlagents makes before launching a player
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.bind(('localhost', port))
+        return True
+    except OSError:
+        return False
+    finally:
+        s.close()
+
+
+class WorkerIdLease(object):
+    """A worker id held by this process until release() or the process exits."""
+
+    def __init__(self, worker_id: int, lock_file=None):
+        self.worker_id = worker_id
+        self._lock_file = lock_file
+
+    @property
+    def port(self) -> int:
+        return BASE_PORT + self.worker_id
+
+    def release(self) -> None:
+        if self._lock_file is not None:
+            # Closing the file drops the flock, the lock file stays for the next holder
+            self._lock_file.close()
+            self._lock_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _try_lock(directory: str, worker_id: int):
+    # Return the locked registry file of worker_id, None if another process holds it
+    lock_file = open(os.path.join(directory, f'{worker_id}.lock'), 'a+')
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    # Record the holder for whoever inspects the registry
+    lock_file.truncate(0)
+    lock_file.write(f'{os.getpid()}\n')
+    lock_file.flush()
+    return lock_file
+
+
+def allocate_worker_id(start: int = 0, stop: int = MAX_WORKER_ID,
+                       directory: Optional[str] = None) -> WorkerIdLease:
+    """Lease the lowest worker id in [start, stop) that no other process holds and
+    whose port is free."""
+    if fcntl is not None:
+        directory = directory or registry_directory()
+        os.makedirs(directory, exist_ok=True)
+    for worker_id in range(start, stop):
+        lock_file = None
+        if fcntl is not None:
+            lock_file = _try_lock(directory, worker_id)
+            if lock_file is None:
+                continue
+        if port_is_free(BASE_PORT + worker_id):
+            return WorkerIdLease(worker_id, lock_file)
+        if lock_file is not None:
+            lock_file.close()
+    raise RuntimeError(f'No free L2Explorer worker id in [{start}, {stop})')
+
+
+def allocate_worker_ids(count: int, start: int = 0, stop: int = MAX_WORKER_ID,
+                        directory: Optional[str] = None) -> List[WorkerIdLease]:
+    """Lease count worker ids, see allocate_worker_id"""
+    leases = []
+    try:
+        for _ in range(count):
+            first = leases[-1].worker_id + 1 if leases else start
+            leases.append(allocate_worker_id(first, stop, directory))
+    except:
+        for lease in leases:
+            lease.release()
+        raise
+    return leases
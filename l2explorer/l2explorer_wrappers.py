@@ -0,0 +1,153 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from gym import spaces
+
+from .l2explorer_obs import STATE_KEY
+
+"""
+Wrappers around L2ExplorerTask. Like L2ExplorerRecorder they forward reset()
+and step() to the task and pass every other attribute through.
+"""
+
+
+class FrameRing(object):
+    """The last k frames of one observation, in a buffer of 2k slots.
+
+    Frame t is written to slots t % k and t % k + k, so the last k frames are always
+    the contiguous slice [t % k + 1, t % k + k + 1) of the buffer and can be returned
+    as a view, oldest first, at the cost of two frame copies per step.
+    """
+
+    def __init__(self, frame: np.ndarray, k: int):
+        self.k = k
+        self.buffer = np.empty((2 * k,) + frame.shape, dtype=frame.dtype)
+        self.fill(frame)
+
+    def matches(self, frame: np.ndarray) -> bool:
+        return self.buffer.shape[1:] == frame.shape and self.buffer.dtype == frame.dtype
+
+    def fill(self, frame: np.ndarray) -> np.ndarray:
+        # Start of an episode, the stack holds k copies of the first frame
+        self.buffer[:] = frame
+        self._pos = self.k - 1
+        return self.view()
+
+    def push(self, frame: np.ndarray) -> np.ndarray:
+        self._pos = (self._pos + 1) % self.k
+        self.buffer[self._pos] = frame
+        self.buffer[self._pos + self.k] = frame
+        return self.view()
+
+    def view(self) -> np.ndarray:
+        return self.buffer[self._pos + 1:self._pos + self.k + 1]
+
+
+class FrameStack(object):
+    """Stack the last k frames of the visual observations of an L2ExplorerTask.
+
+    Every camera (or other image such as semantic_labels) gains a leading axis of
+    length k, oldest frame first; the state and semantic_histogram stay the latest
+    values. With keys, only those observation entries are stacked. The stacks are
+    views of a FrameRing that the next step() overwrites, copy them to keep them
+    longer. Episodes start with k copies of the reset observation.
+    """
+
+    def __init__(self, task, k: int, keys: Optional[Sequence[str]] = None):
+        if k < 1:
+            raise ValueError('FrameStack needs k of at least 1')
+        self.task = task
+        self.k = k
+        self.keys = None if keys is None else tuple(keys)
+        self._rings: Dict[object, FrameRing] = {}
+
+    def __getattr__(self, name):
+        return getattr(self.task, name)
+
+    def _stacked(self, key: str, value) -> bool:
+        if self.keys is not None:
+            return key in self.keys
+        return key != STATE_KEY and np.ndim(value) >= 2
+
+    def _stack(self, ring_key, frame: np.ndarray, new_episode: bool) -> np.ndarray:
+        ring = self._rings.get(ring_key)
+        if ring is None or not ring.matches(frame):
+            ring = self._rings[ring_key] = FrameRing(frame, self.k)
+            return ring.view()
+        return ring.fill(frame) if new_episode else ring.push(frame)
+
+    def _observation(self, observation, new_episode: bool):
+        stacked = {}
+        for key, value in observation.items():
+            if not self._stacked(key, value):
+                stacked[key] = value
+            elif isinstance(value, list):
+                # The default observation holds a list of cameras
+                stacked[key] = [self._stack((key, i), frame, new_episode) for i, frame in enumerate(value)]
+            else:
+                stacked[key] = self._stack(key, value, new_episode)
+        return stacked
+
+    def reset(self, params):
+        return self._observation(self.task.reset(params), True)
+
+    def step(self, action):
+        observation, reward, done, info = self.task.step(action)
+        if observation:
+            observation = self._observation(observation, False)
+        return observation, reward, done, info
+
+    def _stacked_box(self, box: spaces.Box, stacked: bool) -> spaces.Box:
+        if not stacked:
+            return box
+        return spaces.Box(np.repeat(box.low[None], self.k, axis=0),
+                          np.repeat(box.high[None], self.k, axis=0), dtype=box.dtype)
+
+    def _default_space(self, camera_box: spaces.Box) -> spaces.Dict:
+        # The default observation holds 'visual', a list of cameras or one
+        # [n_cameras, H, W, C] array with obs_buffers, and 'state'; the task space
+        # only describes a single camera
+        layout = self.task.observation_layout
+        visual = self.task.visual_obs
+        stacked = self._stacked('visual', visual)
+        if isinstance(visual, list):
+            visual_space = spaces.Tuple([self._stacked_box(camera_box, stacked) for _ in visual])
+        else:
+            n_cameras = np.shape(visual)[0]
+            visual_space = self._stacked_box(
+                spaces.Box(np.repeat(camera_box.low[None], n_cameras, axis=0),
+                           np.repeat(camera_box.high[None], n_cameras, axis=0), dtype=camera_box.dtype),
+                stacked)
+        state_box = spaces.Box(-np.inf, np.inf, shape=(layout.state_size,), dtype=np.float32)
+        return spaces.Dict({'visual': visual_space,
+                            STATE_KEY: self._stacked_box(state_box, self._stacked(STATE_KEY, np.empty(state_box.shape)))})
+
+    @property
+    def observation_space(self):
+        space = self.task.observation_space
+        if space is None:
+            return None
+        if not isinstance(space, spaces.Dict):
+            return self._default_space(space)
+        stacked = {}
+        for key, box in space.spaces.items():
+            stacked[key] = self._stacked_box(box, self._stacked(key, np.empty(box.shape)))
+        return spaces.Dict(stacked)
@@ -18,6 +18,8 @@ IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import os
 
+from .l2explorer_worker_ids import AUTO_WORKER_ID
+
 
 def get_l2explorer_app_location():
     try:
@@ -32,6 +34,9 @@ def get_l2explorer_app_location():
 
 
 def get_l2explorer_worker_id():
+    # L2EXPLORER_WORKER_ID=auto leases free ids from the registry in l2explorer_worker_ids.py
+    if os.environ.get('L2EXPLORER_WORKER_ID', '').lower() == AUTO_WORKER_ID:
+        return AUTO_WORKER_ID
     try:
         worker_id = int(os.environ['L2EXPLORER_WORKER_ID'])
     except:
@@ -41,3 +46,15 @@ def get_l2explorer_worker_id():
               ' users run setx L2EXPLORER_WORKER_ID 0 ')
         raise
     return worker_id
+
+
+BACKENDS = ('unity', 'fake')
+
+
+def get_l2explorer_backend():
+    # The fake backend runs an in-process stand-in for the Unity player, see l2explorer_fake.py
+    backend = os.environ.get('L2EXPLORER_BACKEND', 'unity').lower()
+    if backend not in BACKENDS:
+        print(f'ERROR: L2EXPLORER_BACKEND must be one of {BACKENDS}, got {backend}')
+        raise ValueError(f'Unknown L2Explorer backend {backend}')
+    return backend
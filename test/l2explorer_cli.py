@@ -317,6 +317,7 @@ class L2ExplorerPrompt(Cmd):
 
 
 if __name__ == "__main__":
+    prompt = None
     try:
         # Initialize argument parser
         parser = argparse.ArgumentParser()
@@ -332,8 +333,10 @@ if __name__ == "__main__":
         os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
         # Start L2Explorer Prompt
-        L2ExplorerPrompt(args.debug, args.editor_mode).cmdloop()
+        prompt = L2ExplorerPrompt(args.debug, args.editor_mode)
+        prompt.cmdloop()
     except KeyboardInterrupt:
         print("\nExiting L2Explorer CLI...")
         # Close L2Explorer environment gracefully
-        L2ExplorerTask.close_env()
+        if prompt is not None:
+            prompt._env.close_env()
@@ -0,0 +1,149 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import time
+
+os.environ.setdefault('L2EXPLORER_WORKER_ID', 'auto')
+
+import numpy as np
+import pytest
+
+from l2explorer.l2explorer_env import (L2ExplorerRestartedError, L2ExplorerTask,
+                                       UnityGymException)
+from l2explorer.l2explorer_fake import RESET_CHANNEL_ID, FakeUnityEnvironment
+from l2explorer.l2explorer_semantic import LAYER_COLORS
+
+"""
+L2ExplorerTask tests against the fake backend.
+"""
+
+PARAMS = {'max_steps': 50}
+
+
+class SlowFake(FakeUnityEnvironment):
+    # The first player launched takes a second for its fifth step, then answers
+    launches = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        SlowFake.launches += 1
+        self.slow = SlowFake.launches == 1
+        self.steps = 0
+        self.finished = False
+
+    def step(self):
+        self.steps += 1
+        if self.slow and self.steps == 5:
+            time.sleep(1.0)
+            result = super().step()
+            self.finished = True
+            return result
+        return super().step()
+
+    def close(self):
+        # Let the abandoned step finish on this player, as a player answering late would
+        pass
+
+
+def test_abandoned_step_does_not_change_the_task():
+    SlowFake.launches = 0
+    task = L2ExplorerTask(backend=SlowFake, step_timeout=0.3, obs_buffers=1, observation_keys=['rgb', 'state'])
+    try:
+        task.reset(PARAMS)
+        slow_env = task.instance.env
+        with pytest.raises(L2ExplorerRestartedError):
+            for _ in range(10):
+                task.step([1.0, 0.0, 0.0])
+        stepcount = task._stepcount
+        # Wait for the abandoned step to finish on the killed player
+        deadline = time.monotonic() + 5.0
+        while not slow_env.finished and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.1)
+        assert slow_env.finished
+        assert task._stepcount == stepcount
+        assert not task.game_over
+        assert task.instance.env is not slow_env
+    finally:
+        task.close_env()
+
+
+class LateResetFake(FakeUnityEnvironment):
+    # Replies to reset_environment three exchanges late, or with an error when the
+    # params ask for it; other reset channel messages are acknowledged at once
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.late = []
+        self.reset_replied = False
+
+    def _handle_reset(self, request):
+        if request.get("action") != "reset_environment":
+            return super()._handle_reset(request)
+        self.reset_replied = False
+        if request.get("payload", {}).get("reject"):
+            self._reply(RESET_CHANNEL_ID, self._response(request, "error", "Invalid reset params"))
+        else:
+            self.late.append([3, request])
+
+    def _exchange(self, action):
+        for late in list(self.late):
+            late[0] -= 1
+            if late[0] == 0:
+                self.late.remove(late)
+                self._configure(late[1].get("payload", {}))
+                self.reset_replied = True
+                self._reply(RESET_CHANNEL_ID, self._response(late[1], "ack", "Reset Configured"))
+        super()._exchange(action)
+
+
+def test_reset_waits_for_its_own_reply():
+    task = L2ExplorerTask(backend=LateResetFake)
+    try:
+        task.reset(PARAMS)
+        assert task.instance.env.reset_replied
+        # The object acknowledgement arrives first, it must not end the reset handshake
+        task.spawn_object({'class': 'tree', 'coordinates': [1.0, 1.0]})
+        task.reset(PARAMS)
+        assert task.instance.env.reset_replied
+        with pytest.raises(UnityGymException, match='rejected'):
+            task.reset(dict(PARAMS, reject=True))
+    finally:
+        task.close_env()
+
+
+class AlternatingFake(FakeUnityEnvironment):
+    # The rgb and semantic cameras alternate between two images every frame
+    def _observations(self, collected):
+        obs = super()._observations(collected)
+        obs[1][:] = 0.25 if self._step_count % 2 else 0.75
+        obs[2][:] = LAYER_COLORS['building' if self._step_count % 2 else 'neutral']
+        return obs
+
+
+def test_max_pool_pools_rgb_and_keeps_the_semantic_palette():
+    task = L2ExplorerTask(backend=AlternatingFake, action_repeat=2, max_pool_frames=True,
+                          observation_keys=['rgb', 'semantic'])
+    try:
+        task.reset(PARAMS)
+        observation = task.step([0.0, 0.0, 0.0])[0]
+        final = 'building' if task.instance.env._step_count % 2 else 'neutral'
+        np.testing.assert_allclose(observation['semantic'][0, 0], LAYER_COLORS[final])
+        np.testing.assert_allclose(observation['rgb'], 0.75)
+    finally:
+        task.close_env()
@@ -0,0 +1,154 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+os.environ.setdefault('L2EXPLORER_WORKER_ID', 'auto')
+
+import pytest
+from mlagents_envs.exception import UnityEnvironmentException
+
+from l2explorer import l2explorer_pool
+from l2explorer.l2explorer_affinity import CpuAffinity
+from l2explorer.l2explorer_env import L2ExplorerRestartedError, UnityGymException
+from l2explorer.l2explorer_fake import FakeUnityEnvironment
+from l2explorer.l2explorer_pool import L2ExplorerPool
+from l2explorer.l2explorer_worker_ids import allocate_worker_ids
+
+"""
+Pool tests against the fake backend.
+"""
+
+PARAMS = {'max_steps': 50}
+
+
+class HangingFake(FakeUnityEnvironment):
+    # The first player launched hangs on its fifth step
+    launches = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        HangingFake.launches += 1
+        self.hangs = HangingFake.launches == 1
+        self.steps = 0
+
+    def step(self):
+        self.steps += 1
+        if self.hangs and self.steps == 5:
+            time.sleep(2.0)
+        return super().step()
+
+
+def test_watchdog_relaunch_keeps_the_pool_slot():
+    HangingFake.launches = 0
+    with L2ExplorerPool(1, backend=HangingFake, health_check_interval=60.0) as pool:
+        task = pool.lease(step_timeout=0.5)
+        task.reset(PARAMS)
+        with pytest.raises(L2ExplorerRestartedError):
+            for _ in range(10):
+                task.step([0.0, 0.0, 0.0])
+        assert task.restarts == 1
+        assert HangingFake.launches == 2
+        # The replacement player runs the replayed episode and goes back to the pool
+        assert task.step([0.0, 0.0, 0.0])[0]
+        pool.release(task)
+        assert pool.available == 1
+        with pool.leased() as task:
+            assert task.reset(PARAMS)
+
+
+class FailingFake(FakeUnityEnvironment):
+    # Only the first launch succeeds
+    launches = 0
+
+    def __init__(self, *args, **kwargs):
+        FailingFake.launches += 1
+        if FailingFake.launches > 1:
+            raise UnityEnvironmentException('Player failed to start')
+        super().__init__(*args, **kwargs)
+
+
+def test_failed_relaunch_is_reported(monkeypatch):
+    monkeypatch.setattr(l2explorer_pool, 'RELAUNCH_BACKOFF', 0.0)
+    FailingFake.launches = 0
+    with L2ExplorerPool(1, backend=FailingFake, health_check_interval=60.0) as pool:
+        task = pool.lease()
+        worker_id = task.worker_id
+        # The player dies during the lease, its replacement never starts
+        task.instance.env.close()
+        pool.release(task)
+        with pytest.raises(UnityGymException, match='lost'):
+            pool.lease(timeout=10.0)
+        assert FailingFake.launches == 1 + l2explorer_pool.RELAUNCH_ATTEMPTS
+        assert list(pool.lost) == [worker_id]
+
+
+class ProcessFake(FakeUnityEnvironment):
+    # Starts a stand-in player process, which the pool can pin
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.proc1 = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+
+    def close(self):
+        self.proc1.kill()
+        self.proc1.wait()
+        super().close()
+
+
+def test_leased_tasks_report_the_pool_pinning():
+    cpu = min(os.sched_getaffinity(0))
+    with L2ExplorerPool(1, backend=ProcessFake, cpu_affinity=[CpuAffinity((cpu,), (), 5)]) as pool:
+        with pool.leased() as task:
+            pid = task.instance.env.proc1.pid
+            assert os.sched_getaffinity(pid) == {cpu}
+            assert task.metrics.info['cpu_affinity'] == {'player_cpus': str(cpu), 'nice': '5'}
+            assert f'player_cpus="{cpu}"' in task.metrics.to_prometheus()
+    # The fake backend has no player process, nothing is pinned or reported
+    with L2ExplorerPool(1, backend='fake', cpu_affinity=[CpuAffinity((cpu,), (), 5)]) as pool:
+        with pool.leased() as task:
+            assert 'cpu_affinity' not in task.metrics.info
+            assert 'cpu_affinity' not in task.metrics.to_prometheus()
+    with L2ExplorerPool(1, backend='fake') as pool:
+        with pool.leased() as task:
+            assert 'cpu_affinity' not in task.metrics.info
+
+
+def test_failed_launch_cleans_up():
+    FailingFake.launches = 0
+    closed = []
+
+    class ClosingFake(FailingFake):
+        def close(self):
+            closed.append(self.worker_id)
+            super().close()
+
+    leases = allocate_worker_ids(3)
+    free_ids = [lease.worker_id for lease in leases]
+    for lease in leases:
+        lease.release()
+    with pytest.raises(UnityEnvironmentException):
+        L2ExplorerPool(3, base_worker_id='auto', backend=ClosingFake)
+    # The one player that started is closed and its worker ids are free again
+    assert len(closed) == 1
+    leases = allocate_worker_ids(3)
+    assert [lease.worker_id for lease in leases] == free_ids
+    for lease in leases:
+        lease.release()
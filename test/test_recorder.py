@@ -0,0 +1,90 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+
+import numpy as np
+
+os.environ.setdefault('L2EXPLORER_WORKER_ID', 'auto')
+
+from l2explorer.l2explorer_env import L2ExplorerTask
+from l2explorer.l2explorer_fake import FakeUnityEnvironment
+from l2explorer.l2explorer_recorder import L2ExplorerRecorder
+
+"""
+Recorder tests against the fake backend.
+"""
+
+
+class CountingFake(FakeUnityEnvironment):
+    # Fills the rgb camera with the step count, so every frame differs
+    def _observations(self, collected):
+        obs = super()._observations(collected)
+        obs[1][:] = self._step_count * 0.01
+        return obs
+
+
+def test_recorded_frames_match_returned_frames(tmp_path):
+    # With obs_buffers=1 every step overwrites the observation the task returned
+    # before, the recorder must keep the frame the action was taken from
+    task = L2ExplorerTask(backend=CountingFake, obs_buffers=1, observation_keys=['rgb', 'state'])
+    returned = []
+    try:
+        with L2ExplorerRecorder(task, str(tmp_path), chunk_size=4, compress=False) as recorder:
+            observation = recorder.reset({'max_steps': 6})
+            returned.append(np.array(observation['rgb']))
+            done = False
+            while not done:
+                observation, _, done, _ = recorder.step([1.0, 0.5, 0.0])
+                returned.append(np.array(observation['rgb']))
+    finally:
+        task.close_env()
+
+    recorded = np.concatenate([np.load(os.path.join(tmp_path, name, 'rgb.npy'))
+                               for name in sorted(os.listdir(tmp_path)) if name.startswith('chunk_')])
+    assert len(recorded) == len(returned)
+    assert any(not np.array_equal(a, b) for a, b in zip(returned, returned[1:]))
+    for i, frame in enumerate(returned):
+        np.testing.assert_array_equal(recorded[i], frame)
+
+
+def test_flush_mid_episode(tmp_path):
+    task = L2ExplorerTask(backend=CountingFake, obs_buffers=1, observation_keys=['rgb', 'state'])
+    returned = []
+    try:
+        with L2ExplorerRecorder(task, str(tmp_path), chunk_size=8, compress=False) as recorder:
+            observation = recorder.reset({'max_steps': 6})
+            returned.append(np.array(observation['rgb']))
+            done = False
+            while not done:
+                observation, _, done, _ = recorder.step([1.0, 0.5, 0.0])
+                returned.append(np.array(observation['rgb']))
+                if len(returned) == 3:
+                    # Two rows are committed, the third waits for its action
+                    recorder.flush()
+                    assert len(os.listdir(tmp_path)) == 3
+    finally:
+        task.close_env()
+
+    names = sorted(name for name in os.listdir(tmp_path) if name.startswith('chunk_'))
+    assert len(names) == 2
+    recorded = np.concatenate([np.load(os.path.join(tmp_path, name, 'rgb.npy')) for name in names])
+    steps = np.concatenate([np.load(os.path.join(tmp_path, name, 'step.npy')) for name in names])
+    np.testing.assert_array_equal(steps, np.arange(len(returned)))
+    for i, frame in enumerate(returned):
+        np.testing.assert_array_equal(recorded[i], frame)
@@ -0,0 +1,59 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import gc
+import json
+import os
+import weakref
+
+os.environ.setdefault('L2EXPLORER_WORKER_ID', 'auto')
+
+from l2explorer.l2explorer_env import L2ExplorerTask
+from l2explorer.l2explorer_pool import L2ExplorerPool
+from l2explorer.l2explorer_trace import ChromeTracer
+
+"""
+ChromeTracer tests against the fake backend.
+"""
+
+PARAMS = {'max_steps': 10}
+
+
+def test_closed_tasks_are_not_kept_by_the_tracer(tmp_path):
+    with ChromeTracer(str(tmp_path / 'trace.json')) as tracer:
+        tasks = []
+        with L2ExplorerPool(1, backend='fake') as pool:
+            for _ in range(5):
+                with pool.leased(tracer=tracer) as task:
+                    task.reset(PARAMS)
+                    task.step([0.0, 0.0, 0.0])
+                    tasks.append(weakref.ref(task))
+                del task
+        gc.collect()
+        assert all(task() is None for task in tasks)
+
+
+def test_task_is_traced_again_after_close(tmp_path):
+    path = str(tmp_path / 'trace.json')
+    with ChromeTracer(path) as tracer:
+        task = L2ExplorerTask(backend='fake', tracer=tracer)
+        for _ in range(2):
+            task.reset(PARAMS)
+            task.close_env()
+    resets = [event for event in json.load(open(path)) if event['name'] == 'reset']
+    assert len(resets) == 2
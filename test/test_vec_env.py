@@ -0,0 +1,54 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+
+os.environ.setdefault('L2EXPLORER_WORKER_ID', 'auto')
+
+import numpy as np
+
+from l2explorer.l2explorer_fake import FakeUnityEnvironment
+from l2explorer.l2explorer_vec_env import L2ExplorerVecEnv
+
+"""
+L2ExplorerVecEnv tests against the fake backend.
+"""
+
+
+class CountingFake(FakeUnityEnvironment):
+    # Fills the rgb camera with the step count, so every frame differs
+    def _observations(self, collected):
+        obs = super()._observations(collected)
+        obs[1][:] = self._step_count * 0.01
+        return obs
+
+
+def test_terminal_observation_survives_the_auto_reset():
+    with L2ExplorerVecEnv(1, backend=CountingFake, obs_buffers=2, observation_keys=['rgb', 'state']) as env:
+        observation = env.reset({'max_steps': 4})
+        reset_rgb = float(observation['rgb'][0, 0, 0, 0])
+        for _ in range(10):
+            previous = float(observation['rgb'][0, 0, 0, 0])
+            observation, _, dones, infos = env.step(np.zeros((1, 3)))
+            if dones[0]:
+                break
+        assert dones[0]
+        terminal = infos[0]['terminal_observation']['rgb']
+        # The frame after the previous one, not the first frame of the next episode
+        np.testing.assert_allclose(terminal, previous + 0.01, rtol=1e-5)
+        np.testing.assert_allclose(observation['rgb'][0], reset_rgb)
@@ -0,0 +1,51 @@
+"""
+Copyright © 2021 The Johns Hopkins University Applied Physics Laboratory LLC
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to
+deal in the Software without restriction, including without limitation the
+rights to use, copy, modify, merge, publish, distribute, sublicense, and/or
+sell copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY,
+WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR
+IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+
+os.environ.setdefault('L2EXPLORER_WORKER_ID', 'auto')
+
+import pytest
+
+from l2explorer.l2explorer_env import L2ExplorerTask
+from l2explorer.l2explorer_wrappers import FrameStack
+
+"""
+Wrapper tests against the fake backend.
+"""
+
+PARAMS = {'max_steps': 50}
+
+
+@pytest.mark.parametrize('task_kwargs', [
+    {},
+    {'obs_buffers': 2, 'uint8_visual': True},
+    {'observation_keys': ['rgb', 'semantic', 'state', 'semantic_histogram']},
+    {'observation_keys': ['rgb', 'depth', 'state'], 'depth_format': 'uint16', 'obs_buffers': 2},
+])
+def test_frame_stack_observation_space_contains_observations(task_kwargs):
+    task = L2ExplorerTask(backend='fake', **task_kwargs)
+    try:
+        stack = FrameStack(task, 4)
+        observation = stack.reset(PARAMS)
+        assert stack.observation_space.contains(observation)
+        for _ in range(3):
+            observation = stack.step([1.0, 0.5, 0.0])[0]
+        assert stack.observation_space.contains(observation)
+    finally:
+        task.close_env()